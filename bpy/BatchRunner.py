@@ -0,0 +1,252 @@
+# run one of the KrusTool operators over many .blend files in background Blender
+#
+# driver (plain python, spawns the blender workers):
+#   python BatchRunner.py job.json [--workers 8] [--no-resume]
+# worker (started by the driver, one file per process):
+#   blender -b --python BatchRunner.py -- --worker job.json file.blend result.json input_root
+#
+# job spec (json):
+# {
+#     "blender": "blender",                          # blender executable
+#     "tool": "UnifyNormals",                        # script in this folder that has register()
+#     "operator": "object.unify_normals_operator",
+#     "operator_args": {},
+#     "files": ["assets/props", "assets/hero.blend"],  # .blend files and/or directories
+#     "recursive": true,
+#     "window_manager": {"b_write_into_vertex_color": true},  # replaces the panel inputs,
+#     "scene": {"target_obj": "Barrel"},             # pointer properties take object/collection names
+#     "select": ["Barrel*"],                         # fnmatch patterns on object names, default keeps the file's selection
+#     "active": "Barrel",
+#     "save": true,                                  # save in place, or
+#     "output_dir": "processed",                     # save copies under this folder, in the same subfolders
+#                                                    # as below the folder all the files have in common
+#     "workers": 4,
+#     "timeout": 600,                                # seconds per file
+#     "manifest": "manifest.jsonl"                   # one line per processed file, used to resume
+# }
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+_script_path = os.path.abspath(__file__)
+_script_dir = os.path.dirname(_script_path)
+
+# job keys that only change how the batch runs, not what it does to a file
+_RUNTIME_KEYS = {"blender", "workers", "timeout", "manifest", "files", "recursive"}
+
+
+### driver
+
+def load_job(job_path):
+    with open(job_path) as f:
+        job = json.load(f)
+    job.setdefault("blender", "blender")
+    job.setdefault("operator_args", {})
+    job.setdefault("recursive", True)
+    job.setdefault("workers", max(1, (os.cpu_count() or 2) // 2))
+    job.setdefault("timeout", 600)
+    job.setdefault("manifest", os.path.splitext(job_path)[0] + "_manifest.jsonl")
+    for key in ("tool", "operator", "files"):
+        if key not in job:
+            raise ValueError(f"job spec is missing '{key}'")
+    return job
+
+# a changed parameter makes every file due again
+def job_hash(job):
+    spec = {key: value for key, value in job.items() if key not in _RUNTIME_KEYS}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+def collect_files(job, base_dir):
+    files = []
+    for entry in job["files"]:
+        path = os.path.abspath(os.path.join(base_dir, entry))
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(".blend"))
+                if not job["recursive"]:
+                    break
+                dirs.sort()
+        elif path.endswith(".blend"):
+            files.append(path)
+    # keep order, drop duplicates
+    return list(dict.fromkeys(files))
+
+# deepest folder holding every file, copies in output_dir keep their paths below it so files
+# with the same name in different folders don't overwrite each other
+def input_root(files, base_dir):
+    return os.path.commonpath([os.path.dirname(path) for path in files]) if files else base_dir
+
+# files that already finished with this job spec
+def read_manifest(manifest_path, current_hash):
+    done = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by a crash
+                    continue
+                if entry.get("job") == current_hash and entry.get("status") == "ok":
+                    done.add(entry["file"])
+    return done
+
+def run_file(job, job_path, blend_path, root):
+    fd, result_path = tempfile.mkstemp(suffix=".json", prefix="krus_batch_")
+    os.close(fd)
+    command = [job["blender"], "-b", "--python-exit-code", "1", "--python", _script_path,
+               "--", "--worker", job_path, blend_path, result_path, root]
+
+    start = time.perf_counter()
+    entry = {"file": blend_path}
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=job["timeout"])
+        entry["returncode"] = process.returncode
+        with open(result_path) as f:
+            content = f.read()
+        if content:
+            entry.update(json.loads(content))
+        else:
+            # blender died before the worker could write its result
+            entry["status"] = "crashed"
+            entry["error"] = process.stderr[-2000:]
+    except subprocess.TimeoutExpired:
+        entry["status"] = "timeout"
+    finally:
+        os.remove(result_path)
+    entry["wall_time"] = time.perf_counter() - start
+    return entry
+
+def run_driver(job_path, workers=None, resume=True):
+    job_path = os.path.abspath(job_path)
+    job = load_job(job_path)
+    current_hash = job_hash(job)
+    base_dir = os.path.dirname(job_path)
+    manifest_path = os.path.join(base_dir, job["manifest"])
+
+    files = collect_files(job, base_dir)
+    # from every file, not just the pending ones, so a resumed run writes to the same paths
+    root = input_root(files, base_dir)
+    done = read_manifest(manifest_path, current_hash) if resume else set()
+    pending = [path for path in files if path not in done]
+    print(f"{len(files)} files, {len(files) - len(pending)} already done, {len(pending)} to run")
+
+    failures = 0
+    start = time.perf_counter()
+    with open(manifest_path, "a") as manifest, ThreadPoolExecutor(max_workers=workers or job["workers"]) as pool:
+        futures = {pool.submit(run_file, job, job_path, path, root): path for path in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            entry["job"] = current_hash
+            entry["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            # one flushed line per file, so a crash of the driver loses nothing that finished
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+
+            if entry.get("status") != "ok":
+                failures += 1
+            print(f"[{count}/{len(pending)}] {entry.get('status')} {entry['wall_time']:.2f}s {entry['file']}")
+
+    print(f"finished in {time.perf_counter() - start:.1f}s, {failures} failed, manifest: {manifest_path}")
+    return failures
+
+
+### worker, runs inside blender
+
+def _resolve_value(bpy, rna_property, value):
+    if rna_property.type != 'POINTER' or not isinstance(value, str):
+        return value
+    if rna_property.fixed_type.identifier == 'Collection':
+        return bpy.data.collections[value]
+    return bpy.data.objects[value]
+
+def _apply_properties(bpy, owner, values):
+    for name, value in values.items():
+        setattr(owner, name, _resolve_value(bpy, owner.bl_rna.properties[name], value))
+
+def _select(bpy, job):
+    view_layer = bpy.context.view_layer
+    if "select" in job:
+        for obj in view_layer.objects:
+            obj.select_set(any(fnmatch.fnmatchcase(obj.name, pattern) for pattern in job["select"]))
+    if "active" in job:
+        view_layer.objects.active = bpy.data.objects[job["active"]]
+
+def run_worker(job_path, blend_path, result_path, root):
+    import bpy
+    import importlib
+    import traceback
+
+    for path in (_script_dir, os.path.join(_script_dir, "modules")):
+        if path not in sys.path:
+            sys.path.append(path)
+
+    job = load_job(job_path)
+    result = {"status": "ok", "timings": {}}
+    timings = result["timings"]
+    try:
+        start = time.perf_counter()
+        bpy.ops.wm.open_mainfile(filepath=blend_path)
+        timings["load"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tool = importlib.import_module(job["tool"])
+        tool.register()
+        _apply_properties(bpy, bpy.context.window_manager, job.get("window_manager", {}))
+        _apply_properties(bpy, bpy.context.scene, job.get("scene", {}))
+        _select(bpy, job)
+        timings["setup"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        category, name = job["operator"].split(".")
+        operator_result = getattr(getattr(bpy.ops, category), name)(**job["operator_args"])
+        timings["operator"] = time.perf_counter() - start
+        result["operator_result"] = sorted(operator_result)
+        if 'FINISHED' not in operator_result:
+            result["status"] = "failed"
+
+        start = time.perf_counter()
+        if result["status"] == "ok" and job.get("output_dir"):
+            output_dir = os.path.join(os.path.dirname(job_path), job["output_dir"])
+            output_path = os.path.join(output_dir, os.path.relpath(blend_path, root))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            bpy.ops.wm.save_as_mainfile(filepath=output_path, copy=True)
+            result["output"] = output_path
+        elif result["status"] == "ok" and job.get("save"):
+            bpy.ops.wm.save_mainfile()
+        timings["save"] = time.perf_counter() - start
+    except Exception:
+        result["status"] = "error"
+        result["error"] = traceback.format_exc()
+
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run a KrusTool operator over many .blend files")
+    parser.add_argument("job", nargs="?")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("--worker", nargs=4, metavar=("JOB", "BLEND", "RESULT", "ROOT"))
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(*args.worker)
+        return 0
+    if not args.job:
+        parser.error("a job spec is required")
+    return 1 if run_driver(args.job, args.workers, not args.no_resume) else 0
+
+if __name__ == "__main__":
+    # blender passes the script's own arguments after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
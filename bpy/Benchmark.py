@@ -0,0 +1,380 @@
+# time the KrusTool operators on synthetic meshes over a ladder of sizes, headless (no GPU needed)
+#
+# in background Blender:
+#   blender -b --factory-startup --python-exit-code 1 --python Benchmark.py -- [options]
+# or with the pip bpy module:
+#   python Benchmark.py [options]
+#
+# options:
+#   --cases UnifyNormals RopeWrap ...       default: every case in CASES
+#   --sizes 1000 10000 100000 1000000       loop counts of the generated inputs
+#   --repeat 3                              timed runs per size, the fastest one counts
+#   --no-memory                             skip the extra profiled run per size (peak memory, bpy.ops calls)
+#   --max-time 120                          seconds; larger sizes of a case are skipped once a run takes longer
+#   --output benchmark.json                 results of this run
+#   --baseline baseline.json                compare against a stored run ...
+#   --update-baseline                       ... or store this run as the baseline
+#   --threshold 0.2 --memory-threshold 0.25 --exponent-threshold 0.15
+#
+# every size runs cold: the file is reset and the inputs are generated again before each run,
+# generation isn't timed. a case regresses when a size is slower than the baseline by more than
+# threshold (and by more than _NOISE_FLOOR), its peak memory grows by more than memory-threshold,
+# its scaling exponent (slope of log time over log loops) grows by more than exponent-threshold,
+# or it fails where the baseline didn't. the exit code is 1 on any regression or failed run.
+# thresholds stored in the baseline apply unless given on the command line
+
+import argparse
+import gc
+import importlib
+import json
+import math
+import os
+import platform
+import sys
+import time
+import traceback
+
+import bpy
+import numpy as np
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+for _path in (_script_dir, os.path.join(_script_dir, "modules")):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+import KrusUtilities as ku
+
+_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+_THRESHOLDS = {"time": 0.2, "memory": 0.25, "exponent": 0.15}
+# seconds, slowdowns below this are timer noise
+_NOISE_FLOOR = 0.005
+# bytes, peak memory growth below this is allocator noise
+_MEMORY_FLOOR = 1 << 20
+# caches keyed by mesh content survive a file reset, they are cleared so every run is cold
+_CONTENT_CACHES = {"SmoothNormalToUV": ("_source_indices",)}
+_DECK_SIZE = 10.0
+
+
+### synthetic inputs, numpy only and the same for the same (loops, seed)
+# every generator returns positions (V, 3), quads (F, 4) and per corner uvs (F, 4, 2)
+
+# quads of an nu x nv grid of vertices (i, j) -> i * columns + j, optionally closed around u and/or v.
+# corners run +u then +v, counter clockwise seen from u x v
+def grid_quads(nu, nv, wrap_u=False, wrap_v=False):
+    columns = nv if wrap_v else nv + 1
+    rows = nu if wrap_u else nu + 1
+    i, j = np.meshgrid(np.arange(nu), np.arange(nv), indexing="ij")
+    i1, j1 = (i + 1) % rows, (j + 1) % columns
+    quads = np.stack((i * columns + j, i1 * columns + j, i1 * columns + j1, i * columns + j1), axis=-1).reshape(-1, 4)
+    corners = np.stack([np.stack(corner, axis=-1) for corner in ((i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1))], axis=2)
+    uvs = corners.reshape(-1, 4, 2) / np.array([nu, nv], dtype=np.float64)
+    return quads, uvs
+
+# a flat deck of _DECK_SIZE x _DECK_SIZE metres in xy, one quad per board
+def grid_deck(loops, seed=0):
+    n = max(1, round(math.sqrt(loops / 4)))
+    quads, uvs = grid_quads(n, n)
+    i, j = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing="ij")
+    positions = np.stack((i.ravel(), j.ravel(), np.zeros(i.size)), axis=1) * (_DECK_SIZE / n)
+    return positions, quads, uvs
+
+def torus(loops, seed=0, major_radius=1.0, minor_radius=0.3):
+    nv = max(3, round(math.sqrt(loops / 8)))
+    nu = 2 * nv
+    quads, uvs = grid_quads(nu, nv, wrap_u=True, wrap_v=True)
+    u, v = np.meshgrid(np.arange(nu) * (2 * np.pi / nu), np.arange(nv) * (2 * np.pi / nv), indexing="ij")
+    ring = major_radius + minor_radius * np.cos(v)
+    positions = np.stack((ring * np.cos(u), ring * np.sin(u), minor_radius * np.sin(v)), axis=-1).reshape(-1, 3)
+    return positions, quads, uvs
+
+# (u axis, v axis) of the cube faces, u x v points out of the cube
+_CUBE_FACES = (((0, 1, 0), (0, 0, 1)), ((0, 0, 1), (0, 1, 0)), ((0, 0, 1), (1, 0, 0)),
+               ((1, 0, 0), (0, 0, 1)), ((1, 0, 0), (0, 1, 0)), ((0, 1, 0), (1, 0, 0)))
+
+# a subdivided cube projected onto the unit sphere, the seams welded
+def cube_sphere(loops, seed=0):
+    n = max(1, round(math.sqrt(loops / 24)))
+    quads, uvs = grid_quads(n, n)
+    a, b = np.meshgrid(np.linspace(-1.0, 1.0, n + 1), np.linspace(-1.0, 1.0, n + 1), indexing="ij")
+    positions = []
+    for u_axis, v_axis in _CUBE_FACES:
+        u_axis, v_axis = np.array(u_axis, dtype=np.float64), np.array(v_axis, dtype=np.float64)
+        points = np.cross(u_axis, v_axis) + a.reshape(-1, 1) * u_axis + b.reshape(-1, 1) * v_axis
+        positions.append(points / np.linalg.norm(points, axis=1, keepdims=True))
+    positions = np.concatenate(positions)
+    face_quads = np.concatenate([quads + face * (n + 1) ** 2 for face in range(len(_CUBE_FACES))])
+
+    # border vertices of neighbouring faces land on the same point
+    welded, index = np.unique(np.round(positions, 9), axis=0, return_inverse=True)
+    return welded, index.reshape(-1)[face_quads], np.tile(uvs, (len(_CUBE_FACES), 1, 1))
+
+# a body and a head, two noisy ellipsoids as separate islands
+def noisy_character(loops, seed=0):
+    rng = np.random.default_rng(seed)
+    parts = []
+    # (share of the loops, scale, offset)
+    for share, scale, offset in ((0.8, (0.45, 0.3, 0.9), (0.0, 0.0, 0.9)), (0.2, (0.22, 0.22, 0.25), (0.0, 0.0, 2.05))):
+        positions, quads, uvs = cube_sphere(loops * share)
+        # a few low frequency waves plus some per vertex jitter, along the sphere normal
+        waves = sum(amplitude * np.sin(positions @ rng.normal(size=3) * frequency + rng.uniform(0, 2 * np.pi))
+                    for amplitude, frequency in ((0.06, 3.0), (0.03, 7.0), (0.015, 13.0)))
+        noise = 1.0 + waves + rng.normal(scale=0.004, size=len(positions))
+        parts.append((positions * noise[:, None] * np.array(scale) + np.array(offset), quads, uvs))
+
+    vertex_offsets = np.cumsum([0] + [len(positions) for positions, _, _ in parts[:-1]])
+    return (np.concatenate([positions for positions, _, _ in parts]),
+            np.concatenate([quads + vertex_offset for (_, quads, _), vertex_offset in zip(parts, vertex_offsets)]),
+            np.concatenate([uvs for _, _, uvs in parts]))
+
+def mesh_object(context, name, positions, quads, uvs):
+    mesh = ku.fill_mesh(bpy.data.meshes.new(name), positions, quads.ravel(), np.arange(len(quads)) * 4, uvs.reshape(-1, 2))
+    obj = bpy.data.objects.new(name, mesh)
+    context.scene.collection.objects.link(obj)
+    return obj
+
+def select_only(context, objects):
+    for obj in context.view_layer.objects:
+        obj.select_set(obj in objects)
+    context.view_layer.objects.active = objects[0]
+
+
+### cases: name -> (tool script, operator, setup).
+# setup(context, loops) builds the inputs, sets the tool's properties and returns the loop count
+# the operator works on
+
+def setup_unify_normals(context, loops):
+    obj = mesh_object(context, "character", *noisy_character(loops))
+    wm = context.window_manager
+    wm.unify_normals_mode = 'ANALYTIC'
+    wm.unify_normals_scope = 'SELECTED'
+    select_only(context, [obj])
+    return len(obj.data.loops)
+
+def setup_smooth_normal_to_uv(context, loops):
+    source = mesh_object(context, "character", *noisy_character(loops))
+    target = mesh_object(context, "character_target", *noisy_character(loops, seed=1))
+    wm = context.window_manager
+    wm.source_object = source
+    wm.target_object = target
+    wm.smooth_normal_targets = 'OBJECT'
+    return len(target.data.loops)
+
+def setup_inset_faces(context, loops):
+    obj = mesh_object(context, "deck", *grid_deck(loops))
+    # a tenth of a board's width
+    context.window_manager.inset_depth = 0.1 * _DECK_SIZE / math.sqrt(len(obj.data.polygons))
+    select_only(context, [obj])
+    return len(obj.data.loops)
+
+def setup_generate_boards(context, loops):
+    loop_count = setup_inset_faces(context, loops)
+    context.window_manager.board_thickness = 0.02
+    return loop_count
+
+def setup_rope_wrap(context, loops):
+    target = mesh_object(context, "sphere", *cube_sphere(loops))
+    # a tilted quad through the sphere's center
+    plane = mesh_object(context, "plane", np.array([(-2, -2, 0), (2, -2, 0), (2, 2, 0), (-2, 2, 0)], dtype=np.float64),
+                        np.array([[0, 1, 2, 3]]), np.array([[(0, 0), (1, 0), (1, 1), (0, 1)]], dtype=np.float64))
+    plane.rotation_euler = (0.3, 0.2, 0.0)
+    context.view_layer.update()
+    context.scene.target_obj = target
+    context.scene.plane_obj = plane
+    return len(target.data.loops)
+
+def setup_rope_attacher(context, loops):
+    target = mesh_object(context, "torus", *torus(loops))
+    # a helix winding around the torus tube, a little off its surface
+    curve = bpy.data.curves.new("helix", 'CURVE')
+    curve.dimensions = '3D'
+    spline = curve.splines.new('POLY')
+    t = np.linspace(0.0, 2 * np.pi, 256, endpoint=False)
+    ring = 1.0 + 0.36 * np.cos(12 * t)
+    points = np.stack((ring * np.cos(t), ring * np.sin(t), 0.36 * np.sin(12 * t), np.ones_like(t)), axis=1)
+    spline.points.add(len(points) - 1)
+    ku.write_array(spline.points, "co", points)
+    spline.use_cyclic_u = True
+    curve_obj = bpy.data.objects.new("helix", curve)
+    context.scene.collection.objects.link(curve_obj)
+    context.scene.mesh_obj = target
+    context.scene.curve_obj = curve_obj
+    return len(target.data.loops)
+
+CASES = {
+    "UnifyNormals": ("UnifyNormals", "object.unify_normals_operator", setup_unify_normals),
+    "SmoothNormalToUV": ("SmoothNormalToUV", "object.smooth_normal_to_uv_operator", setup_smooth_normal_to_uv),
+    "InsetFaces": ("MeshFaceToBoard", "object.inset_faces", setup_inset_faces),
+    "GenerateBoards": ("MeshFaceToBoard", "object.generate_boards", setup_generate_boards),
+    "RopeWrap": ("RopeWrap", "object.rope_wrap", setup_rope_wrap),
+    "RopeAttacher": ("RopeAttacher", "object.rope_attacher", setup_rope_attacher),
+}
+
+
+### running
+
+def register_tools(names):
+    tools = {}
+    for name in names:
+        tool_name = CASES[name][0]
+        if tool_name not in tools:
+            tools[tool_name] = importlib.import_module(tool_name)
+            tools[tool_name].register()
+    return tools
+
+# an empty file; the tools' load handlers drop their caches with the old one
+def reset(tools):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    for tool_name, tool in tools.items():
+        for cache in _CONTENT_CACHES.get(tool_name, ()):
+            getattr(tool, cache).clear()
+    gc.collect()
+
+def call_operator(operator):
+    category, name = operator.split(".")
+    return getattr(getattr(bpy.ops, category), name)()
+
+# repeat timed runs of one case at one size, then one profiled run for memory and bpy.ops calls
+def run_size(tools, name, loops, repeat, memory):
+    tool_name, operator, setup = CASES[name]
+    entry = {"target_loops": loops, "status": "ok"}
+    walls = []
+    try:
+        for run in range(repeat + (1 if memory else 0)):
+            reset(tools)
+            entry["loops"] = setup(bpy.context, loops)
+            profiling = run == repeat
+            if profiling:
+                ku.profiler.enable()
+            try:
+                start = time.perf_counter()
+                result = call_operator(operator)
+                elapsed = time.perf_counter() - start
+            finally:
+                ku.profiler.disable()
+            if 'FINISHED' not in result:
+                raise RuntimeError(f"{operator} returned {sorted(result)}")
+            if profiling:
+                profile = ku.profiler.runs[-1]
+                entry["peak_memory"] = profile["peak_memory"]
+                entry["ops"] = sum(profile["ops"].values())
+            else:
+                walls.append(elapsed)
+        entry["wall"] = min(walls)
+        entry["walls"] = walls
+    except Exception:
+        entry["status"] = "error"
+        entry["error"] = traceback.format_exc()
+    return entry
+
+# slope of log(time) over log(loops); sizes under the noise floor only count when nothing else is left
+def scaling_exponent(entries):
+    timed = [entry for entry in entries if entry["status"] == "ok"]
+    above_noise = [entry for entry in timed if entry["wall"] >= _NOISE_FLOOR]
+    if len(above_noise) >= 2:
+        timed = above_noise
+    if len({entry["loops"] for entry in timed}) < 2:
+        return None
+    loops = np.log([entry["loops"] for entry in timed])
+    walls = np.log([max(entry["wall"], 1e-9) for entry in timed])
+    return float(np.polyfit(loops, walls, 1)[0])
+
+def run_benchmark(names, sizes, repeat=3, memory=True, max_time=120.0):
+    tools = register_tools(names)
+    results = {"blender": bpy.app.version_string, "python": platform.python_version(), "platform": platform.platform(),
+               "repeat": repeat, "sizes": list(sizes), "cases": {}}
+    for name in names:
+        entries = []
+        too_slow = False
+        for loops in sizes:
+            if too_slow:
+                entries.append({"target_loops": loops, "status": "skipped"})
+                continue
+            entry = run_size(tools, name, loops, repeat, memory)
+            entries.append(entry)
+            if entry["status"] == "ok":
+                peak = f"{entry['peak_memory'] / (1024 * 1024):8.1f} MB" if "peak_memory" in entry else ""
+                print(f"{name:<18} {entry['loops']:>9} loops {entry['wall'] * 1000:10.1f}ms {peak}")
+                too_slow = entry["wall"] > max_time
+            else:
+                print(f"{name:<18} {loops:>9} loops  {entry['status']}\n{entry['error']}")
+        exponent = scaling_exponent(entries)
+        results["cases"][name] = {"sizes": entries, "exponent": exponent}
+        if exponent is not None:
+            print(f"{name:<18} scaling exponent {exponent:.2f}")
+    return results
+
+# regressions of results against baseline, as readable lines
+def compare(results, baseline, thresholds):
+    regressions = []
+    for name, case in results["cases"].items():
+        base_case = baseline.get("cases", {}).get(name)
+        if base_case is None:
+            continue
+        base_sizes = {entry["target_loops"]: entry for entry in base_case["sizes"]}
+        for entry in case["sizes"]:
+            base = base_sizes.get(entry["target_loops"])
+            # failed runs are reported on their own
+            if base is None or base["status"] != "ok" or entry["status"] != "ok":
+                continue
+            label = f"{name} @ {entry['target_loops']} loops"
+            if entry["wall"] - base["wall"] > _NOISE_FLOOR and entry["wall"] > base["wall"] * (1 + thresholds["time"]):
+                regressions.append(f"{label}: {base['wall'] * 1000:.1f}ms -> {entry['wall'] * 1000:.1f}ms "
+                                   f"(+{(entry['wall'] / base['wall'] - 1) * 100:.0f}%, threshold {thresholds['time'] * 100:.0f}%)")
+            if "peak_memory" in entry and "peak_memory" in base:
+                growth = entry["peak_memory"] - base["peak_memory"]
+                if growth > _MEMORY_FLOOR and entry["peak_memory"] > base["peak_memory"] * (1 + thresholds["memory"]):
+                    regressions.append(f"{label}: peak memory {base['peak_memory'] / (1024 * 1024):.1f} MB -> "
+                                       f"{entry['peak_memory'] / (1024 * 1024):.1f} MB")
+        if case["exponent"] is not None and base_case.get("exponent") is not None:
+            if case["exponent"] - base_case["exponent"] > thresholds["exponent"]:
+                regressions.append(f"{name}: scaling exponent {base_case['exponent']:.2f} -> {case['exponent']:.2f}")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the KrusTool operators on synthetic meshes")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=lambda value: int(float(value)), default=list(_SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--max-time", type=float, default=120.0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float)
+    parser.add_argument("--memory-threshold", type=float)
+    parser.add_argument("--exponent-threshold", type=float)
+    args = parser.parse_args(argv)
+    if args.update_baseline and not args.baseline:
+        parser.error("--update-baseline needs --baseline")
+
+    baseline = None
+    if args.baseline and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    thresholds = dict(_THRESHOLDS, **(baseline or {}).get("thresholds", {}))
+    for key, value in (("time", args.threshold), ("memory", args.memory_threshold), ("exponent", args.exponent_threshold)):
+        if value is not None:
+            thresholds[key] = value
+
+    results = run_benchmark(args.cases, sorted(args.sizes), max(1, args.repeat), not args.no_memory, args.max_time)
+    results["thresholds"] = thresholds
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"baseline written to {args.baseline}")
+
+    failed = [f"{name} @ {entry['target_loops']} loops: {entry['status']}"
+              for name, case in results["cases"].items() for entry in case["sizes"] if entry["status"] == "error"]
+    regressions = compare(results, baseline, thresholds) if baseline else []
+    for line in failed + regressions:
+        print("FAIL " + line)
+    print(f"{len(results['cases'])} cases, {len(failed)} failed runs, {len(regressions)} regressions, results: {args.output}")
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    # blender passes the script's own arguments after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
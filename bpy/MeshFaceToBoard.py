@@ -1,37 +1,348 @@
 import bpy
+import time
+import numpy as np
+
+import KrusUtilities as ku
 
 class InsetFacesOperator(bpy.types.Operator):
     bl_idname = "object.inset_faces"
     bl_label = "Inset Faces"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        # edit mode keeps its own copy of the mesh, which would overwrite ours on exit
+        return context.mode == 'OBJECT'
 
+    @ku.profiled
     def execute(self, context):
         inset_depth = context.window_manager.inset_depth
+        start = time.perf_counter()
+
+        # every mesh once, however many selected objects share it; the first object supplies the
+        # vertex group names the mesh's deform weights refer to
+        meshes = {}
+        for obj in context.selected_objects:
+            if obj.type == 'MESH' and obj.data.library is None:
+                meshes.setdefault(obj.data.as_pointer(), obj)
 
-        # Loop through all selected objects
-        for obj in bpy.context.selected_objects:
-            # Make sure the object is a mesh
-            if obj.type == 'MESH':
-                # Set the object as the active object
-                bpy.context.view_layer.objects.active = obj
-                # Go into edit mode
-                bpy.ops.object.mode_set(mode='EDIT')
-                bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='FACE')
-                # Select all faces
-                bpy.ops.mesh.select_all(action='SELECT')
-                # Inset the faces
-                bpy.ops.mesh.inset(thickness=inset_depth, use_individual=True, use_select_inset=True)
-                #delete selected outer faces
-                bpy.ops.mesh.delete(type='FACE')
-                # Go back to object mode
-                bpy.ops.object.mode_set(mode='OBJECT')
+        face_count = 0
+        skipped = []
+        for obj in meshes.values():
+            mesh = obj.data
+            # shape keys keep the old vertex count, their shapes can't follow the new vertices
+            if mesh.shape_keys is not None:
+                skipped.append(mesh.name)
+                continue
+            face_count += len(mesh.polygons)
+            # inset the faces and delete the outer faces
+            inset_individual(mesh, inset_depth, obj.vertex_groups)
+
+        if skipped:
+            self.report({'WARNING'}, f"Skipped meshes with shape keys: {', '.join(skipped)}")
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        self.report({'INFO'}, f"Inset {face_count} faces of {len(meshes) - len(skipped)} meshes in {elapsed:.2f}s ({face_count / elapsed:.0f} faces/s)")
         return {'FINISHED'}
-    
+
+# generic attributes copied through the inset: foreach field, width and dtype per data type
+_ATTRIBUTE_FIELDS = {
+    'FLOAT': ("value", 1, np.float32),
+    'INT': ("value", 1, np.int32),
+    'INT8': ("value", 1, np.int32),
+    'BOOLEAN': ("value", 1, bool),
+    'FLOAT2': ("vector", 2, np.float32),
+    'FLOAT_VECTOR': ("vector", 3, np.float32),
+    'FLOAT_COLOR': ("color", 4, np.float32),
+    'BYTE_COLOR': ("color", 4, np.float32),
+}
+# handled through the polygons, or rebuilt with the geometry
+_SKIPPED_ATTRIBUTES = {"position", "material_index", "sharp_face"}
+
+# inset every face of mesh on its own by thickness and delete the outer faces, on the mesh data:
+# each face keeps only its inner copy, with vertices of its own. uvs follow the inset, the other
+# point, corner and face attributes and the deform weights of vertex_groups (the object's groups
+# the weights refer to) carry over; edge attributes don't. meshes with shape keys aren't supported
+def inset_individual(mesh, thickness, vertex_groups=None):
+    arrays = ku.mesh_arrays(mesh)
+    positions = arrays.positions
+    loop_vertices = arrays.loop_vertices
+    loop_starts = arrays.loop_starts
+    loop_totals = arrays.loop_totals
+    face_normals = arrays.face_normals
+    material_indices = arrays.read("polygons", "material_index", dtype=np.int32)
+    smooth = arrays.read("polygons", "use_smooth", dtype=bool)
+    uv_layers = {layer.name: arrays.uvs(layer.name) for layer in mesh.uv_layers}
+    attributes = read_attributes(mesh, _SKIPPED_ATTRIBUTES | set(uv_layers))
+    weights = read_deform_weights(mesh) if vertex_groups else None
+
+    # previous and next corner of every corner within its face
+    corner = np.arange(len(loop_vertices))
+    last = loop_starts + loop_totals - 1
+    next_corner = corner + 1
+    next_corner[last] = loop_starts
+    previous_corner = corner - 1
+    previous_corner[loop_starts] = last
+
+    corners = positions[loop_vertices]
+    face_of_corner = np.repeat(np.arange(len(loop_starts)), loop_totals)
+    incoming = corners - corners[previous_corner]
+    outgoing = corners[next_corner] - corners
+    offsets = inset_offsets(incoming, outgoing, face_normals[face_of_corner], thickness)
+
+    # the same offset in uv space, through each corner's two edges
+    along_next, along_previous = edge_coordinates(offsets, outgoing, -incoming)
+    for name, uvs in uv_layers.items():
+        uv_layers[name] = (uvs + along_next[:, None] * (uvs[next_corner] - uvs)
+                           + along_previous[:, None] * (uvs[previous_corner] - uvs))
+
+    mesh.clear_geometry()
+    ku.fill_mesh(mesh, corners + offsets, corner, loop_starts)
+    ku.write_mesh_array(mesh, "polygons", "material_index", material_indices, np.int32)
+    ku.write_mesh_array(mesh, "polygons", "use_smooth", smooth, bool)
+    for name, uvs in uv_layers.items():
+        ku.write_uvs(mesh, name, uvs)
+    write_attributes(mesh, attributes, loop_vertices)
+    if weights is not None:
+        write_deform_weights(vertex_groups, weights, loop_vertices)
+
+# move every corner inwards so it's thickness away from both of its edges
+# (the even offset of an individual inset): offset = thickness * (a + b) / (1 + a.b), with a and b
+# the inward normals of the incoming and outgoing edge within the face
+def inset_offsets(incoming, outgoing, face_normals, thickness):
+    inward_in = np.cross(face_normals, incoming)
+    inward_out = np.cross(face_normals, outgoing)
+    inward_in /= np.maximum(np.linalg.norm(inward_in, axis=1, keepdims=True), 1e-12)
+    inward_out /= np.maximum(np.linalg.norm(inward_out, axis=1, keepdims=True), 1e-12)
+    # spikes that turn back on themselves would send the corner off to infinity
+    denominator = np.maximum(1.0 + np.einsum("ij,ij->i", inward_in, inward_out), 0.1)
+    return thickness * (inward_in + inward_out) / denominator[:, None]
+
+# coordinates (s, r) of offsets in the corner frames offset = s * u + r * v
+def edge_coordinates(offsets, u, v):
+    uu = np.einsum("ij,ij->i", u, u)
+    uv = np.einsum("ij,ij->i", u, v)
+    vv = np.einsum("ij,ij->i", v, v)
+    du = np.einsum("ij,ij->i", offsets, u)
+    dv = np.einsum("ij,ij->i", offsets, v)
+    determinant = uu * vv - uv * uv
+    valid = np.abs(determinant) > 1e-12
+    safe = np.where(valid, determinant, 1.0)
+    return np.where(valid, (du * vv - dv * uv) / safe, 0.0), np.where(valid, (dv * uu - du * uv) / safe, 0.0)
+
+# values of the point, corner and face attributes: [(name, data type, domain, values)]
+def read_attributes(mesh, skipped):
+    attributes = []
+    for attribute in mesh.attributes:
+        if attribute.name.startswith(".") or attribute.name in skipped or attribute.domain not in {'POINT', 'CORNER', 'FACE'}:
+            continue
+        if attribute.data_type not in _ATTRIBUTE_FIELDS:
+            continue
+        field, width, dtype = _ATTRIBUTE_FIELDS[attribute.data_type]
+        attributes.append((attribute.name, attribute.data_type, attribute.domain, ku.read_array(attribute.data, field, width, dtype)))
+    return attributes
+
+def write_attributes(mesh, attributes, loop_vertices):
+    for name, data_type, domain, values in attributes:
+        if domain == 'POINT':
+            # every corner has its own vertex now
+            values = values[loop_vertices]
+        attribute = mesh.attributes.get(name) or mesh.attributes.new(name, data_type, domain)
+        field, _, dtype = _ATTRIBUTE_FIELDS[data_type]
+        ku.write_array(attribute.data, field, values, dtype)
+
+# (vertex, group, weight) of every deform weight.
+# Blender has no bulk accessor for these, so this is one pass over the vertices
+def read_deform_weights(mesh):
+    vertices, groups, weights = [], [], []
+    for vertex in mesh.vertices:
+        for element in vertex.groups:
+            vertices.append(vertex.index)
+            groups.append(element.group)
+            weights.append(element.weight)
+    return np.array(vertices, dtype=np.int64), np.array(groups, dtype=np.int64), np.array(weights, dtype=np.float32)
+
+# every corner's new vertex takes the weights of the corner's old vertex, like the point attributes.
+# VertexGroup.add takes one weight per call, so the corners are added per (group, weight)
+def write_deform_weights(vertex_groups, weights, loop_vertices):
+    vertices, groups, values = weights
+    if len(vertices) == 0:
+        return
+    # the corners of every old vertex
+    counts = np.bincount(loop_vertices, minlength=vertices.max() + 1)
+    order = np.argsort(loop_vertices, kind="stable")
+    starts = np.cumsum(counts) - counts
+    entry = np.repeat(np.arange(len(vertices)), counts[vertices])
+    rank = np.arange(len(entry)) - np.repeat(np.cumsum(counts[vertices]) - counts[vertices], counts[vertices])
+    corners = order[starts[vertices[entry]] + rank]
+
+    # runs of equal (group, weight)
+    sort = np.lexsort((values[entry], groups[entry]))
+    keys = np.stack((groups[entry][sort], values[entry][sort].view(np.int32)), axis=1)
+    bounds = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+    for run in np.split(sort, bounds):
+        group = groups[entry[run[0]]]
+        if group < len(vertex_groups):
+            vertex_groups[group].add(corners[run].tolist(), float(values[entry[run[0]]]), 'REPLACE')
+
+class GenerateBoardsOperator(bpy.types.Operator):
+    bl_idname = "object.generate_boards"
+    bl_label = "Generate Boards"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @ku.profiled
+    def execute(self, context):
+        wm = context.window_manager
+        start = time.perf_counter()
+
+        # a board per face of every selected mesh, into <object>_boards; objects sharing a mesh share the boards
+        sources = [obj for obj in context.selected_objects if obj.type == 'MESH' and "board_id" not in obj.data.attributes]
+        boards = {}
+        board_count = 0
+        for obj in sources:
+            key = obj.data.as_pointer()
+            if key not in boards:
+                boards[key] = build_boards(obj.data, wm.inset_depth, wm.board_thickness, wm.board_thickness_jitter,
+                                           wm.board_bevel, wm.board_height_jitter, wm.board_seed)
+                board_count += len(obj.data.polygons)
+            board_object(context, obj, boards[key])
+
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        self.report({'INFO'}, f"{board_count} boards of {len(boards)} meshes in {elapsed:.2f}s ({board_count / elapsed:.0f} boards/s)")
+        return {'FINISHED'}
+
+# a solid board for every face of mesh, in a new mesh: the face inset by gap, extruded along its normal
+# by a jittered thickness, raised by a jittered height and with its top edges bevelled (chamfered).
+# every face gets the integer board_id of its source face and a board_random value in [0, 1),
+# the same seed always builds the same boards
+def build_boards(mesh, gap, thickness, thickness_jitter, bevel, height_jitter, seed):
+    arrays = ku.mesh_arrays(mesh)
+    positions = arrays.positions
+    loop_vertices = arrays.loop_vertices
+    loop_starts = arrays.loop_starts
+    loop_totals = arrays.loop_totals
+    face_normals = arrays.face_normals
+    material_indices = arrays.read("polygons", "material_index", dtype=np.int32)
+    board_count = len(loop_starts)
+    corner_count = len(loop_vertices)
+
+    rng = np.random.default_rng(seed)
+    board_random = rng.random(board_count)
+    thicknesses = thickness * (1.0 + thickness_jitter * rng.uniform(-1.0, 1.0, board_count))
+    heights = height_jitter * rng.uniform(-1.0, 1.0, board_count)
+    bevels = np.minimum(bevel, thicknesses * 0.5)
+
+    # corners of the source faces, with their previous and next corner within the face
+    corner = np.arange(corner_count)
+    last = loop_starts + loop_totals - 1
+    next_corner = corner + 1
+    next_corner[last] = loop_starts
+    previous_corner = corner - 1
+    previous_corner[loop_starts] = last
+    face_of_corner = np.repeat(np.arange(board_count), loop_totals)
+
+    corners = positions[loop_vertices]
+    normals = face_normals[face_of_corner]
+    incoming = corners - corners[previous_corner]
+    outgoing = corners[next_corner] - corners
+    base = corners + inset_offsets(incoming, outgoing, normals, gap)
+
+    # the top bevel insets the board once more, by at most half the board's width (twice the smallest
+    # distance from its center to an edge) so narrow boards close up instead of turning inside out
+    centers = np.stack([np.bincount(face_of_corner, weights=base[:, axis], minlength=board_count)
+                        for axis in range(3)], axis=1) / loop_totals[:, None]
+    edges = base[next_corner] - base
+    edge_distance = (np.linalg.norm(np.cross(edges, centers[face_of_corner] - base), axis=1)
+                     / np.maximum(np.linalg.norm(edges, axis=1), 1e-12))
+    half_width = np.full(board_count, np.inf)
+    np.minimum.at(half_width, face_of_corner, edge_distance)
+    bevels = np.minimum(bevels, half_width)
+
+    # rings of corners from the bottom up: the base, and the bevel's lower and upper edge
+    # (a single top ring without a bevel), as (height above the face, extra inset) per board
+    if bevel > 0:
+        rings = [(heights, 0.0), (heights + thicknesses - bevels, 0.0), (heights + thicknesses, bevels)]
+    else:
+        rings = [(heights, 0.0), (heights + thicknesses, 0.0)]
+    ring_heights = []
+    ring_positions = []
+    for ring_height, ring_inset in rings:
+        ring = base + normals * ring_height[face_of_corner, None]
+        if np.ndim(ring_inset):
+            ring += inset_offsets(incoming, outgoing, normals, ring_inset[face_of_corner, None])
+        ring_heights.append(ring_height[face_of_corner] - heights[face_of_corner])
+        ring_positions.append(ring)
+    top = (len(rings) - 1) * corner_count
+
+    # bottom faces run backwards to face down, top faces keep the source winding, then the sides
+    reversed_corner = loop_starts[face_of_corner] + last[face_of_corner] - corner
+    sides = [np.stack((ring * corner_count + corner, ring * corner_count + next_corner,
+                       (ring + 1) * corner_count + next_corner, (ring + 1) * corner_count + corner), axis=1)
+             for ring in range(len(rings) - 1)]
+    side_count = len(sides) * corner_count
+    out_loop_vertices = np.concatenate([reversed_corner, top + corner] + [side.ravel() for side in sides])
+    out_loop_starts = np.concatenate((loop_starts, corner_count + loop_starts, 2 * corner_count + np.arange(side_count) * 4))
+    face_board = np.concatenate((np.arange(board_count), np.arange(board_count), np.tile(face_of_corner, len(sides))))
+
+    # uvs in world units: caps projected on the face's own axes, sides unrolled along the perimeter
+    u_axis = outgoing / np.maximum(np.linalg.norm(outgoing, axis=1, keepdims=True), 1e-12)
+    u_axis = u_axis[loop_starts][face_of_corner]
+    v_axis = np.cross(normals, u_axis)
+    origin = base[loop_starts][face_of_corner]
+
+    def cap_uvs(points):
+        relative = points - origin
+        return np.stack((np.einsum("ij,ij->i", relative, u_axis), np.einsum("ij,ij->i", relative, v_axis)), axis=1)
+
+    # a float64 running sum, restarted at every face: a float32 one over the whole mesh
+    # drifts by centimetres on the last of 100k+ boards
+    edge_length = np.linalg.norm(outgoing, axis=1).astype(np.float64)
+    perimeter = np.cumsum(edge_length) - edge_length
+    perimeter -= perimeter[loop_starts][face_of_corner]
+    side_uvs = []
+    for ring in range(len(rings) - 1):
+        u0, u1 = perimeter, perimeter + edge_length
+        v0, v1 = ring_heights[ring], ring_heights[ring + 1]
+        side_uvs.append(np.stack((np.stack((u0, v0), axis=1), np.stack((u1, v0), axis=1),
+                                  np.stack((u1, v1), axis=1), np.stack((u0, v1), axis=1)), axis=1).reshape(-1, 2))
+    uvs = np.concatenate([cap_uvs(ring_positions[0])[reversed_corner], cap_uvs(ring_positions[-1])] + side_uvs)
+
+    boards = ku.fill_mesh(bpy.data.meshes.new(mesh.name + "_boards"), np.concatenate(ring_positions),
+                          out_loop_vertices, out_loop_starts, uvs)
+    for material in mesh.materials:
+        boards.materials.append(material)
+    ku.write_array(boards.polygons, "material_index", material_indices[face_board], np.int32)
+    ku.write_array(boards.attributes.new("board_id", 'INT', 'FACE').data, "value", face_board, np.int32)
+    ku.write_array(boards.attributes.new("board_random", 'FLOAT', 'FACE').data, "value", board_random[face_board])
+    return boards
+
+# the <source>_boards object from the scratch pool, reused between runs, with its mesh replaced by
+# boards. a user object that happens to have the name is left alone
+def board_object(context, source_obj, boards):
+    board_obj = ku.scratch_pool.acquire_new(context, source_obj.name + "_boards", 'MESH', lambda key: boards, keep=True)
+    if board_obj.data != boards:
+        previous = board_obj.data
+        board_obj.data = boards
+        if previous.users == 0:
+            bpy.data.meshes.remove(previous)
+    board_obj.matrix_world = source_obj.matrix_world
+    return board_obj
+
 class InsetFacesButtonOperator(bpy.types.Operator):
     bl_idname = "object.inset_faces_button"
     bl_label = "Inset Faces"
 
     def execute(self, context):
+        # the inset writes mesh data, which is only possible in object mode; edit mode is left
+        # (flushing its changes into the mesh) and entered again afterwards
+        edit_mode = context.mode == 'EDIT_MESH'
+        if edit_mode:
+            bpy.ops.object.mode_set(mode='OBJECT')
+        if not bpy.ops.object.inset_faces.poll():
+            self.report({'ERROR'}, "Inset Faces needs object mode.")
+            return {'CANCELLED'}
         bpy.ops.object.inset_faces()
+        if edit_mode:
+            bpy.ops.object.mode_set(mode='EDIT')
         return {'FINISHED'}
 
 class InsetFacesPanel(bpy.types.Panel):
@@ -52,17 +363,41 @@ class InsetFacesPanel(bpy.types.Panel):
         row = layout.row()
         row.operator("object.inset_faces_button")
 
+        # Boards, the inset depth above is the gap between them
+        box = layout.box()
+        box.label(text="Boards")
+        box.prop(context.window_manager, 'board_thickness')
+        box.prop(context.window_manager, 'board_thickness_jitter')
+        box.prop(context.window_manager, 'board_bevel')
+        box.prop(context.window_manager, 'board_height_jitter')
+        box.prop(context.window_manager, 'board_seed')
+        box.operator("object.generate_boards")
+
 def register():
     bpy.types.WindowManager.inset_depth = bpy.props.FloatProperty(name="Inset Depth", default=0.01)
+    bpy.types.WindowManager.board_thickness = bpy.props.FloatProperty(name="Thickness", default=0.02, min=0, precision=4)
+    bpy.types.WindowManager.board_thickness_jitter = bpy.props.FloatProperty(name="Thickness Jitter", default=0.1, min=0, max=1, description="Random change of each board's thickness, as a fraction of it")
+    bpy.types.WindowManager.board_bevel = bpy.props.FloatProperty(name="Bevel", default=0.002, min=0, precision=4, description="Chamfer of the boards' top edges")
+    bpy.types.WindowManager.board_height_jitter = bpy.props.FloatProperty(name="Height Jitter", default=0.0, min=0, precision=4, description="Random raise or drop of each board")
+    bpy.types.WindowManager.board_seed = bpy.props.IntProperty(name="Seed", default=0, min=0)
     bpy.utils.register_class(InsetFacesOperator)
+    bpy.utils.register_class(GenerateBoardsOperator)
     bpy.utils.register_class(InsetFacesButtonOperator)
     bpy.utils.register_class(InsetFacesPanel)
 
 def unregister():
     del bpy.types.WindowManager.inset_depth
+    del bpy.types.WindowManager.board_thickness
+    del bpy.types.WindowManager.board_thickness_jitter
+    del bpy.types.WindowManager.board_bevel
+    del bpy.types.WindowManager.board_height_jitter
+    del bpy.types.WindowManager.board_seed
     bpy.utils.unregister_class(InsetFacesOperator)
+    bpy.utils.unregister_class(GenerateBoardsOperator)
     bpy.utils.unregister_class(InsetFacesButtonOperator)
     bpy.utils.unregister_class(InsetFacesPanel)
+    ku.release_mesh_arrays()
+    ku.release_scratch_pool()
 
 if __name__ == "__main__":
-    register()
\ No newline at end of file
+    register()
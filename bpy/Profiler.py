@@ -0,0 +1,98 @@
+import bpy
+from bpy_extras.io_utils import ExportHelper
+
+import KrusUtilities as ku
+
+### variables
+_bl_idname_export = "object.krus_profile_export"
+_bl_idname_clear = "object.krus_profile_clear"
+# runs listed in the panel, newest first
+_PANEL_RUNS = 8
+
+# profiling of the KrusTool operators (see ku.Profiler), turned on and off from the panel
+def update_profiling(self, context):
+    if context.window_manager.krus_profiling:
+        ku.profiler.enable()
+    else:
+        ku.profiler.disable()
+
+class KrusProfileExportOperator(bpy.types.Operator, ExportHelper):
+    bl_idname = _bl_idname_export
+    bl_label = "Export Profile"
+
+    filename_ext = ".json"
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+    format: bpy.props.EnumProperty(
+        name="Format",
+        items=[
+            ('CHROME', "Chrome Trace", "Trace events for chrome://tracing or ui.perfetto.dev"),
+            ('JSON', "JSON", "The recorded runs as they are"),
+        ],
+        default='CHROME'
+    )
+
+    def execute(self, context):
+        if not ku.profiler.runs:
+            self.report({'WARNING'}, "No profiled runs to export.")
+            return {'CANCELLED'}
+        if self.format == 'CHROME':
+            ku.profiler.export_chrome_trace(self.filepath)
+        else:
+            ku.profiler.export_json(self.filepath)
+        self.report({'INFO'}, f"{len(ku.profiler.runs)} runs written to {self.filepath}")
+        return {'FINISHED'}
+
+class KrusProfileClearOperator(bpy.types.Operator):
+    bl_idname = _bl_idname_clear
+    bl_label = "Clear Profile"
+
+    def execute(self, context):
+        ku.profiler.clear()
+        return {'FINISHED'}
+
+class KrusProfilerPanel(bpy.types.Panel):
+    bl_label = "Profiler"
+    bl_idname = "PT_krus_profiler"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "KrusTool"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        row = layout.row()
+        row.prop(context.window_manager, 'krus_profiling')
+
+        runs = list(ku.profiler.runs)[-_PANEL_RUNS:]
+        for run in reversed(runs):
+            box = layout.box()
+            box.label(text=ku.Profiler.summary(run))
+            for stage_name, seconds in run["stages"].items():
+                box.label(text=f"    {stage_name} {seconds * 1000:.1f}ms")
+            ops = sorted(run["ops"].items(), key=lambda item: -item[1])
+            if ops:
+                box.label(text="    " + ", ".join(f"{idname} x{count}" for idname, count in ops[:4]))
+
+        row = layout.row()
+        row.enabled = bool(runs)
+        row.operator(_bl_idname_export)
+        row.operator(_bl_idname_clear)
+
+def register():
+    ### properties
+    bpy.types.WindowManager.krus_profiling = bpy.props.BoolProperty(name="Profile Operators", default=False, description="Record time, bpy.ops calls, datablocks and memory of every KrusTool operator run", update=update_profiling)
+
+    bpy.utils.register_class(KrusProfileExportOperator)
+    bpy.utils.register_class(KrusProfileClearOperator)
+    bpy.utils.register_class(KrusProfilerPanel)
+
+def unregister():
+    ku.profiler.disable()
+    del bpy.types.WindowManager.krus_profiling
+    bpy.utils.unregister_class(KrusProfileExportOperator)
+    bpy.utils.unregister_class(KrusProfileClearOperator)
+    bpy.utils.unregister_class(KrusProfilerPanel)
+
+if __name__ == "__main__":
+    register()
@@ -1,67 +1,509 @@
-# mesh_obj and curve_obj must have enough vertices to snap to each other
+# curve_obj is projected onto mesh_obj, and subdivided where the surface bends away between points
 
 import bpy
 import bmesh
+import hashlib
+import heapq
+import math
 import mathutils
+import time
+import numpy as np
+from collections import OrderedDict
 from mathutils import Vector, kdtree
+from mathutils.bvhtree import BVHTree
+
+import KrusUtilities as ku
 
 class OBJECT_OT_rope_attacher(bpy.types.Operator):
     bl_idname = "object.rope_attacher"
     bl_label = "Rope Attacher"
     bl_options = {'REGISTER', 'UNDO'}
 
+    @ku.profiled
     def execute(self, context):
-        # pre
-        mesh_obj = context.scene.mesh_obj
-        # smooth_factor = context.scene.smooth_factor
-        # smooth_iterations = context.scene.smooth_iterations
-        curve_extrude = context.scene.curve_extrude
-        curve_depth = context.scene.curve_depth
-        curve_cyclic = context.scene.curve_cyclic
-
-        # copy curve_obj
-        curve_obj_name = context.scene.curve_obj.name + "_copy"
-        # delete
-        if curve_obj_name in bpy.data.objects:
-            bpy.data.objects.remove(bpy.data.objects[curve_obj_name], do_unlink=True)
-        curve_obj = context.scene.curve_obj.copy()
-        curve_obj.data = context.scene.curve_obj.data.copy()
-        curve_obj.name = curve_obj_name
-        bpy.context.collection.objects.link(curve_obj)
-
-        # select curve_obj
-        bpy.context.view_layer.objects.active = curve_obj
-        curve_obj.select_set(True)
-        bpy.ops.object.make_single_user(object=True, obdata=True)
-
-        # add SHRINKWRAP modifier
-        bpy.ops.object.modifier_add(type='SHRINKWRAP')
-        bpy.context.object.modifiers["Shrinkwrap"].use_apply_on_spline = True
-        curve_obj.modifiers["Shrinkwrap"].target = mesh_obj
-        curve_obj.modifiers["Shrinkwrap"].offset = context.scene.offset
-
-        # add SMOOTH modifier
-        # bpy.ops.object.modifier_add(type='SMOOTH')
-        # curve_obj.modifiers["Smooth"].factor = smooth_factor
-        # curve_obj.modifiers["Smooth"].iterations = smooth_iterations
-
-        # apply modifier
-        bpy.ops.object.modifier_apply(modifier="Shrinkwrap")
-        # bpy.ops.object.modifier_apply(modifier="Smooth")
-
-        # curve params
-        curve_obj.data.dimensions = '3D'
-        bpy.context.object.data.extrude = curve_extrude
-        bpy.context.object.data.bevel_depth = curve_depth
-        bpy.context.object.data.splines[0].use_cyclic_u = curve_cyclic
-        bpy.context.object.data.splines[0].use_bezier_u = False
-        bpy.context.object.data.splines[0].use_endpoint_u = False
+        if not (context.scene.curve_obj and context.scene.mesh_obj):
+            self.report({'ERROR'}, "Pick a curve and a mesh first.")
+            return {'CANCELLED'}
+        # a button press always starts over
+        scene = context.scene
+        attach(context, scene.curve_obj, scene.mesh_obj, attach_params(scene, scene.curve_obj), rebuild=True)
 
         # deselect all
         bpy.ops.object.select_all(action='DESELECT')
 
         return {'FINISHED'}
 
+class OBJECT_OT_rope_attacher_batch(bpy.types.Operator):
+    bl_idname = "object.rope_attacher_batch"
+    bl_label = "Rope Attacher - Batch"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @ku.profiled
+    def execute(self, context):
+        scene = context.scene
+        if not (scene.curve_collection and scene.mesh_obj):
+            self.report({'ERROR'}, "Pick a curve collection and a mesh first.")
+            return {'CANCELLED'}
+        curves = [obj for obj in scene.curve_collection.all_objects
+                  if obj.type == 'CURVE' and "rope_attacher_source" not in obj]
+        if not curves:
+            self.report({'WARNING'}, f"No curves in {scene.curve_collection.name}.")
+            return {'CANCELLED'}
+
+        # the projector is built once and shared by every curve, unchanged curves are skipped by attach
+        start = time.perf_counter()
+        get_projector(scene.mesh_obj, context.evaluated_depsgraph_get())
+        setup_time = time.perf_counter() - start
+
+        latencies = []
+        for source_obj in curves:
+            curve_start = time.perf_counter()
+            attach(context, source_obj, scene.mesh_obj, attach_params(scene, source_obj))
+            latencies.append(time.perf_counter() - curve_start)
+
+        total = time.perf_counter() - start
+        latencies = np.array(latencies)
+        slowest = curves[int(latencies.argmax())]
+        self.report({'INFO'}, f"{len(curves)} curves in {total:.2f}s (target {setup_time * 1000:.1f}ms), per curve "
+                              f"{latencies.min() * 1000:.1f}ms min / {np.median(latencies) * 1000:.1f}ms median / "
+                              f"{latencies.max() * 1000:.1f}ms max ({slowest.name})")
+        return {'FINISHED'}
+
+### surface projection
+
+# refinement stops after this many rounds of halving, so a segment splits into at most 64
+_MAX_SUBDIVISIONS = 6
+
+# smoothing rounds per resolution level that pull a geodesic edge path taut, and the number of
+# paths kept per mesh
+_STRAIGHTEN_ITERATIONS = 16
+_PATH_CACHE_SIZE = 256
+
+# nearest surface points of mesh_obj's evaluated mesh, queried in world space
+class SurfaceProjector:
+    def __init__(self, mesh_obj, depsgraph):
+        self.mesh_obj = mesh_obj
+        evaluated = mesh_obj.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+        try:
+            mesh.calc_loop_triangles()
+            positions = ku.read_array(mesh.vertices, "co", 3)
+            triangles = ku.read_array(mesh.loop_triangles, "vertices", 3, np.int32)
+            self.edges = ku.read_array(mesh.edges, "vertices", 2, np.int32).astype(np.int64)
+        finally:
+            evaluated.to_mesh_clear()
+        # built in the mesh's local space, moving the mesh doesn't need a rebuild
+        self.bvh = BVHTree.FromPolygons(positions.tolist(), triangles.tolist())
+        self.positions = positions.astype(np.float64)
+
+        # edge graph for geodesic routing, built on first use
+        self._graph = None
+        self._vertex_paths = OrderedDict()
+        self._surface_paths = OrderedDict()
+
+    # same as a nearest surface point shrinkwrap: every point moves onto the surface and then
+    # offset away from it along the line it came from
+    def project(self, points, offset):
+        matrix = np.array(self.mesh_obj.matrix_world)
+        local = points @ np.linalg.inv(matrix[:3, :3]).T - np.linalg.solve(matrix[:3, :3], matrix[:3, 3])
+        hits = np.array(points, dtype=np.float64)
+        found = np.zeros(len(points), dtype=bool)
+        for index, point in enumerate(local.tolist()):
+            hit = self.bvh.find_nearest(point)[0]
+            if hit is not None:
+                hits[index] = hit
+                found[index] = True
+        hits[found] = hits[found] @ matrix[:3, :3].T + matrix[:3, 3]
+
+        if offset == 0:
+            return hits
+        away = points - hits
+        distance = np.linalg.norm(away, axis=1, keepdims=True)
+        moved = distance[:, 0] > 1e-12
+        hits[moved] += away[moved] * (offset / distance[moved])
+        return hits
+
+    ### geodesic routing, everything in the mesh's local space
+
+    # edge graph as python lists (faster to walk from python than arrays): for every vertex its
+    # neighbours indices[indptr[v]:indptr[v + 1]] at edge lengths weights[...], plus a kd-tree
+    def graph(self):
+        if self._graph is None:
+            both = np.concatenate((self.edges, self.edges[:, ::-1]))
+            lengths = np.linalg.norm(self.positions[both[:, 0]] - self.positions[both[:, 1]], axis=1)
+            order = np.argsort(both[:, 0], kind="stable")
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(both[:, 0], minlength=len(self.positions)))))
+
+            tree = kdtree.KDTree(len(self.positions))
+            for index, co in enumerate(self.positions.tolist()):
+                tree.insert(co, index)
+            tree.balance()
+            self._graph = (indptr.tolist(), both[order, 1].tolist(), lengths[order].tolist(), self.positions.tolist(), tree)
+        return self._graph
+
+    # shortest edge path between two vertices, A* with the straight line distance as heuristic
+    def vertex_path(self, start, goal):
+        key = (start, goal)
+        if key in self._vertex_paths:
+            self._vertex_paths.move_to_end(key)
+            return self._vertex_paths[key]
+
+        indptr, indices, weights, points, _ = self.graph()
+        goal_point = points[goal]
+        distances = {start: 0.0}
+        previous = {start: start}
+        heap = [(math.dist(points[start], goal_point), start)]
+        closed = set()
+        while heap:
+            _, vertex = heapq.heappop(heap)
+            if vertex == goal:
+                break
+            if vertex in closed:
+                continue
+            closed.add(vertex)
+            distance = distances[vertex]
+            for edge in range(indptr[vertex], indptr[vertex + 1]):
+                neighbour = indices[edge]
+                candidate = distance + weights[edge]
+                if candidate < distances.get(neighbour, math.inf):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = vertex
+                    heapq.heappush(heap, (candidate + math.dist(points[neighbour], goal_point), neighbour))
+
+        path = None
+        if goal in previous:
+            path = [goal]
+            while path[-1] != start:
+                path.append(previous[path[-1]])
+            path.reverse()
+        self._cache(self._vertex_paths, key, path)
+        return path
+
+    # nearest surface points and normals
+    def nearest(self, points):
+        hits = np.array(points, dtype=np.float64)
+        normals = np.zeros_like(hits)
+        for index, point in enumerate(hits.tolist()):
+            hit, normal, _, _ = self.bvh.find_nearest(point)
+            if hit is not None:
+                hits[index] = hit
+                normals[index] = normal
+        return hits, normals
+
+    # path over the surface between two anchor points: the edge path between their nearest vertices,
+    # pulled taut by smoothing it and putting it back onto the surface, with the surface normals
+    def surface_path(self, start_point, goal_point):
+        key = (start_point, goal_point)
+        if key in self._surface_paths:
+            self._surface_paths.move_to_end(key)
+            return self._surface_paths[key]
+
+        _, _, _, points, tree = self.graph()
+        vertices = self.vertex_path(tree.find(start_point)[1], tree.find(goal_point)[1])
+        if vertices is None:
+            # anchors on disconnected pieces, bridge them in a straight line
+            vertices = []
+        path = np.array([start_point] + [points[vertex] for vertex in vertices[1:-1]] + [goal_point])
+
+        # coarse to fine, smoothing only needs a few rounds per level to pull the path taut,
+        # ending with one point per edge of the edge path
+        count = max(len(vertices), 2) + 1
+        level = min(count, 5)
+        while True:
+            path = resample_polyline(path, level)
+            for _ in range(_STRAIGHTEN_ITERATIONS):
+                path[1:-1] = path[1:-1] * 0.5 + (path[:-2] + path[2:]) * 0.25
+                path[1:-1] = self.nearest(path[1:-1])[0]
+            if level == count:
+                break
+            level = min(level * 2 - 1, count)
+        result = self.nearest(path)
+        self._cache(self._surface_paths, key, result)
+        return result
+
+    @staticmethod
+    def _cache(cache, key, value):
+        cache[key] = value
+        while len(cache) > _PATH_CACHE_SIZE:
+            cache.popitem(last=False)
+
+# projectors by mesh object name, dropped by _drop_edited_meshes when the mesh's geometry changes
+# or the object is gone. a BVH tree doesn't tell its size, so the least recently used ones go
+# first past a count rather than a size in MB
+_PROJECTOR_CACHE_SIZE = 4
+_projectors = OrderedDict()
+
+def get_projector(mesh_obj, depsgraph):
+    projector = _projectors.get(mesh_obj.name)
+    if projector is None:
+        projector = _projectors[mesh_obj.name] = SurfaceProjector(mesh_obj, depsgraph)
+    _projectors.move_to_end(mesh_obj.name)
+    while len(_projectors) > _PROJECTOR_CACHE_SIZE:
+        drop_projector(next(iter(_projectors)))
+    return projector
+
+# the attachments made with a projector hold on to it, they go with it
+def drop_projector(name):
+    projector = _projectors.pop(name, None)
+    if projector is not None:
+        for result_name in [key for key, state in _attachments.items() if state["projector"] is projector]:
+            del _attachments[result_name]
+
+@bpy.app.handlers.persistent
+def _drop_edited_meshes(scene, depsgraph):
+    if not _projectors:
+        return
+    for update in depsgraph.updates:
+        if update.is_updated_geometry and isinstance(update.id, bpy.types.Object):
+            drop_projector(update.id.original.name)
+    for name in [name for name in _projectors if name not in bpy.data.objects]:
+        drop_projector(name)
+
+@bpy.app.handlers.persistent
+def _clear_projectors(*args):
+    _projectors.clear()
+    _attachments.clear()
+
+# world space points of a spline with their (tilt, radius); bezier splines are sampled at their
+# resolution (with the closing segment when cyclic), the other types use their control points
+def spline_points(spline, matrix, cyclic):
+    if spline.type == 'BEZIER':
+        points = spline.bezier_points
+        segments = list(zip(points[:-1], points[1:]))
+        if cyclic:
+            segments.append((points[-1], points[0]))
+        positions = [points[0].co.copy()]
+        attributes = [(points[0].tilt, points[0].radius)]
+        for start, end in segments:
+            samples = mathutils.geometry.interpolate_bezier(start.co, start.handle_right, end.handle_left, end.co, spline.resolution_u + 1)
+            positions.extend(samples[1:])
+            for step in range(1, spline.resolution_u + 1):
+                t = step / spline.resolution_u
+                attributes.append(((1 - t) * start.tilt + t * end.tilt, (1 - t) * start.radius + t * end.radius))
+        if cyclic:
+            # the last sample is the first point again
+            positions.pop()
+            attributes.pop()
+        positions = np.array(positions, dtype=np.float64)
+        attributes = np.array(attributes, dtype=np.float64)
+    else:
+        positions = ku.read_array(spline.points, "co", 4)[:, :3].astype(np.float64)
+        attributes = np.stack((ku.read_array(spline.points, "tilt"), ku.read_array(spline.points, "radius")), axis=1).astype(np.float64)
+
+    matrix = np.array(matrix)
+    return positions @ matrix[:3, :3].T + matrix[:3, 3], attributes
+
+# project a polyline and halve every segment whose projected midpoint is further than tolerance
+# from the middle of its projected ends, until the projection follows the surface.
+# returns the projected points, their attributes and the refined unprojected points
+def attach_polyline(projector, points, attributes, cyclic, offset, tolerance):
+    projected = projector.project(points, offset)
+    for _ in range(_MAX_SUBDIVISIONS):
+        starts = np.arange(len(points) if cyclic else len(points) - 1)
+        ends = (starts + 1) % len(points)
+        if len(starts) == 0:
+            break
+        middles = (points[starts] + points[ends]) * 0.5
+        projected_middles = projector.project(middles, offset)
+        deviation = np.linalg.norm(projected_middles - (projected[starts] + projected[ends]) * 0.5, axis=1)
+        split = deviation > tolerance
+        if not split.any():
+            break
+        # insert after the start of every split segment, at the end for the closing one
+        at = starts[split] + 1
+        points = np.insert(points, at, middles[split], axis=0)
+        projected = np.insert(projected, at, projected_middles[split], axis=0)
+        attributes = np.insert(attributes, at, (attributes[starts[split]] + attributes[ends[split]]) * 0.5, axis=0)
+    return projected, attributes, points
+
+# a result spline is closed like its source spline, unless the source curve object has its own
+# curve_cyclic custom property or the scene's Curve Cyclic closes every spline
+def spline_cyclic(spline, params):
+    return spline.use_cyclic_u if params["curve_cyclic"] is None else bool(params["curve_cyclic"])
+
+# what a result spline keeps from its source spline; plain values, so they outlive the source's data
+def spline_settings(spline, params):
+    return {
+        "type": 'NURBS' if spline.type == 'BEZIER' else spline.type,
+        "use_cyclic_u": spline_cyclic(spline, params),
+        "use_smooth": spline.use_smooth,
+        "resolution_u": spline.resolution_u,
+        "material_index": spline.material_index,
+        "order_u": 4 if spline.type == 'BEZIER' else spline.order_u,
+    }
+
+# count points evenly spaced along an open polyline, from its first to its last point
+def resample_polyline(points, count):
+    arc_length = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))))
+    if arc_length[-1] == 0:
+        return np.repeat(points[:1], count, axis=0)
+    samples = np.linspace(0.0, arc_length[-1], count)
+    return np.stack([np.interp(samples, arc_length, points[:, axis]) for axis in range(3)], axis=1)
+
+# world space control points of a spline with their (tilt, radius), the anchors of a geodesic rope
+def spline_anchors(spline, matrix):
+    points = spline.bezier_points if spline.type == 'BEZIER' else spline.points
+    positions = ku.read_array(points, "co", 3 if spline.type == 'BEZIER' else 4)[:, :3].astype(np.float64)
+    attributes = np.stack((ku.read_array(points, "tilt"), ku.read_array(points, "radius")), axis=1).astype(np.float64)
+    matrix = np.array(matrix)
+    return positions @ matrix[:3, :3].T + matrix[:3, 3], attributes
+
+# shortest surface path through the anchors (world space), offset along the surface normals.
+# only the paths between anchors that moved are routed again, the others come from the cache
+def route_polyline(projector, anchors, attributes, cyclic, offset):
+    matrix = np.array(projector.mesh_obj.matrix_world)
+    local = anchors @ np.linalg.inv(matrix[:3, :3]).T - np.linalg.solve(matrix[:3, :3], matrix[:3, 3])
+    starts = np.arange(len(anchors) if cyclic else len(anchors) - 1)
+    if len(anchors) < 2:
+        return projector.project(anchors, offset), attributes
+
+    positions, normals, path_attributes = [], [], []
+    for start in starts.tolist():
+        end = (start + 1) % len(anchors)
+        path, path_normals = projector.surface_path(tuple(local[start]), tuple(local[end]))
+        arc_length = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+        t = (arc_length / max(arc_length[-1], 1e-12))[:, None]
+        # consecutive paths share their anchor, keep it once
+        last = len(path) if (start == starts[-1] and not cyclic) else -1
+        positions.append(path[:last])
+        normals.append(path_normals[:last])
+        path_attributes.append(((1 - t) * attributes[start] + t * attributes[end])[:last])
+
+    positions = np.concatenate(positions) @ matrix[:3, :3].T + matrix[:3, 3]
+    normals = np.concatenate(normals) @ np.linalg.inv(matrix[:3, :3])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    return positions + normals * offset, np.concatenate(path_attributes)
+
+# attach one spline: projected and refined, or routed over the surface between its control points
+def attach_spline(projector, spline, matrix, params):
+    if params["attach_mode"] == 'GEODESIC':
+        anchors, attributes = spline_anchors(spline, matrix)
+        positions, attributes = route_polyline(projector, anchors, attributes, spline_cyclic(spline, params), params["offset"])
+        return positions, attributes, None
+    cyclic = spline_cyclic(spline, params)
+    points, attributes = spline_points(spline, matrix, cyclic)
+    return attach_polyline(projector, points, attributes, cyclic, params["offset"], params["attach_tolerance"])
+
+# write attached polylines (world space) as the splines of curve, in place of the old ones
+def write_attached_splines(curve, matrix, polylines, templates):
+    inverse = np.array(matrix.inverted_safe())
+    curve.splines.clear()
+    for (positions, attributes), template in zip(polylines, templates):
+        spline = curve.splines.new(template["type"])
+        spline.points.add(len(positions) - 1)
+        coordinates = np.ones((len(positions), 4), dtype=np.float32)
+        coordinates[:, :3] = positions @ inverse[:3, :3].T + inverse[:3, 3]
+        spline.points.foreach_set("co", coordinates.ravel())
+        spline.points.foreach_set("tilt", attributes[:, 0].astype(np.float32))
+        spline.points.foreach_set("radius", attributes[:, 1].astype(np.float32))
+        spline.use_cyclic_u = template["use_cyclic_u"]
+        spline.use_smooth = template["use_smooth"]
+        spline.resolution_u = template["resolution_u"]
+        spline.material_index = template["material_index"]
+        if spline.type == 'NURBS':
+            spline.order_u = template["order_u"]
+
+# content hash of a curve's splines and transform, changes whenever the projection has to start over
+def curve_content_hash(curve_obj):
+    arrays = [np.array(curve_obj.matrix_world, dtype=np.float32)]
+    for spline in curve_obj.data.splines:
+        arrays.append(np.array([spline.use_cyclic_u, spline.resolution_u, len(spline.points), len(spline.bezier_points)], dtype=np.int32))
+        if spline.type == 'BEZIER':
+            arrays.extend(ku.read_array(spline.bezier_points, attr, 3) for attr in ("co", "handle_left", "handle_right"))
+            arrays.extend(ku.read_array(spline.bezier_points, attr) for attr in ("tilt", "radius"))
+        else:
+            arrays.extend(ku.read_array(spline.points, attr) for attr in ("co", "tilt", "radius"))
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+# the result curve object of a source curve, a kept object of the scratch pool reused between runs
+def result_object(context, source_obj):
+    def new_curve(name):
+        curve = bpy.data.curves.new(name, 'CURVE')
+        curve.dimensions = '3D'
+        for material in source_obj.data.materials:
+            curve.materials.append(material)
+        return curve
+
+    result_obj = ku.scratch_pool.acquire_new(context, source_obj.name + "_copy", 'CURVE', new_curve, keep=True)
+    result_obj["rope_attacher_source"] = source_obj.name
+    return result_obj
+
+# what every result object was built from: source curve hash, projector, mesh transform, tolerance,
+# offset, the refined source points and spline settings. compared against the current inputs to find
+# the stages that are dirty
+_attachments = {}
+
+# parameters of one attachment; custom properties with the same names on a curve object
+# override the scene's values for that curve. an unset curve_cyclic (None) keeps every spline's
+# own cyclic flag: the scene's Curve Cyclic only closes splines, a custom property opens or closes them
+_PARAMETERS = ("attach_mode", "offset", "attach_tolerance", "curve_depth", "curve_extrude")
+
+def attach_params(scene, source_obj):
+    params = {name: source_obj.get(name, getattr(scene, name)) for name in _PARAMETERS}
+    params["curve_cyclic"] = source_obj.get("curve_cyclic", True if scene.curve_cyclic else None)
+    return params
+
+# bring the result object of source_obj up to date, redoing only the dirty stages: a changed source
+# curve, target mesh (geometry or transform) or tolerance samples and refines again, a changed offset
+# only re-projects the refined points, the curve params are always just set
+def attach(context, source_obj, mesh_obj, params, rebuild=False):
+    offset = params["offset"]
+    tolerance = params["attach_tolerance"]
+    result_obj = result_object(context, source_obj)
+    projector = get_projector(mesh_obj, context.evaluated_depsgraph_get())
+    source_hash = curve_content_hash(source_obj)
+    mesh_matrix = tuple(map(tuple, mesh_obj.matrix_world))
+    state = _attachments.get(result_obj.name)
+
+    refine_dirty = (rebuild or state is None or state["source"] != source_hash or state["projector"] is not projector
+                    or state["mesh_matrix"] != mesh_matrix or state["tolerance"] != tolerance
+                    or state["mode"] != params["attach_mode"] or state["cyclic"] != params["curve_cyclic"])
+    offset_dirty = refine_dirty or state["offset"] != offset
+
+    # geodesic ropes offset along the surface normals of their paths, which come from the path cache
+    if refine_dirty or (offset_dirty and params["attach_mode"] == 'GEODESIC'):
+        templates = []
+        refined = []
+        projected = []
+        for spline in source_obj.data.splines:
+            positions, attributes, points = attach_spline(projector, spline, source_obj.matrix_world, params)
+            templates.append(spline_settings(spline, params))
+            refined.append((points, attributes))
+            projected.append((positions, attributes))
+        state = _attachments[result_obj.name] = {
+            "source": source_hash,
+            "projector": projector,
+            "mesh_matrix": mesh_matrix,
+            "tolerance": tolerance,
+            "mode": params["attach_mode"],
+            "cyclic": params["curve_cyclic"],
+            "offset": offset,
+            "refined": refined,
+            "templates": templates,
+        }
+    elif offset_dirty:
+        projected = [(projector.project(points, offset), attributes) for points, attributes in state["refined"]]
+        state["offset"] = offset
+
+    if offset_dirty:
+        result_obj.matrix_world = source_obj.matrix_world
+        write_attached_splines(result_obj.data, result_obj.matrix_world, projected, state["templates"])
+    apply_curve_params(result_obj, params)
+    return result_obj
+
+def apply_curve_params(result_obj, params):
+    curve = result_obj.data
+    curve.dimensions = '3D'
+    curve.extrude = params["curve_extrude"]
+    curve.bevel_depth = params["curve_depth"]
+    for spline in curve.splines:
+        spline.use_bezier_u = False
+        spline.use_endpoint_u = False
+
+
 class OBJECT_PT_rope_attacher(bpy.types.Panel):
     bl_idname = "object.rope_attacher_panel"
     bl_label = "Rope Attacher"
@@ -79,7 +521,9 @@ class OBJECT_PT_rope_attacher(bpy.types.Panel):
 
         box1 = layout.box()
         box1.label(text="Skrinkwrap Params")
+        box1.prop(context.scene, "attach_mode")
         box1.prop(context.scene, "offset")
+        box1.prop(context.scene, "attach_tolerance")
 
         # box2 = layout.box()
         # box2.label(text="Smooth Params")
@@ -94,39 +538,71 @@ class OBJECT_PT_rope_attacher(bpy.types.Panel):
         
         layout.operator("object.rope_attacher")
 
-def update_property(self, context):
-    curve_obj = context.scene.curve_obj
-    if curve_obj:
-        # Use getattr to get the value of the property with the same name as the update function
-        for mod in curve_obj.modifiers:
-            if hasattr(mod, self.bl_rna.identifier):
-                setattr(mod, self.bl_rna.identifier, getattr(context.scene, self.bl_rna.identifier))
+        box4 = layout.box()
+        box4.label(text="Batch")
+        box4.prop(context.scene, "curve_collection")
+        box4.operator("object.rope_attacher_batch")
+        box4.label(text="Scratch objects: " + ku.scratch_pool.summary())
 
-    # Trigger viewport update
-    bpy.ops.object.rope_attacher()
-    context.view_layer.update()
+# curve params only change the result's curve data
+def update_curve_params(self, context):
+    result_obj = ku.scratch_pool.find(context.scene.curve_obj.name + "_copy") if context.scene.curve_obj else None
+    if result_obj is not None and result_obj.type == 'CURVE':
+        apply_curve_params(result_obj, attach_params(context.scene, context.scene.curve_obj))
+
+# offset and tolerance go through attach, which redoes only what they invalidate
+def update_projection(self, context):
+    scene = context.scene
+    if scene.curve_obj and scene.mesh_obj:
+        attach(context, scene.curve_obj, scene.mesh_obj, attach_params(scene, scene.curve_obj))
 
 def register():
     bpy.utils.register_class(OBJECT_OT_rope_attacher)
     bpy.utils.register_class(OBJECT_PT_rope_attacher)
+    bpy.utils.register_class(OBJECT_OT_rope_attacher_batch)
 
     bpy.types.Scene.curve_obj = bpy.props.PointerProperty(type=bpy.types.Object, name="Curve", description="Curve to snap to the mesh", poll=lambda self, obj: obj.type == 'CURVE')
+    bpy.types.Scene.curve_collection = bpy.props.PointerProperty(type=bpy.types.Collection, name="Curves", description="Curves to snap to the mesh in one batch; attach_mode, offset, attach_tolerance, curve_depth, curve_extrude and curve_cyclic custom properties on a curve override the panel values")
     bpy.types.Scene.mesh_obj = bpy.props.PointerProperty(type=bpy.types.Object, name="Mesh", description="Mesh to snap the curve to", poll=lambda self, obj: obj.type == 'MESH')
     
-    bpy.types.Scene.offset = bpy.props.FloatProperty(name="Offset", description="Offset distance", default=0.0, update=update_property)
+    bpy.types.Scene.attach_mode = bpy.props.EnumProperty(
+        name="Mode",
+        items=[
+            ('PROJECT', "Project", "Snap the curve to the nearest surface"),
+            ('GEODESIC', "Geodesic", "Route the shortest path over the surface through the curve's control points"),
+        ],
+        default='PROJECT',
+        update=update_projection
+    )
+    bpy.types.Scene.offset = bpy.props.FloatProperty(name="Offset", description="Offset distance", default=0.0, update=update_projection)
+    bpy.types.Scene.attach_tolerance = bpy.props.FloatProperty(name="Tolerance", description="Subdivide the curve where it leaves the surface by more than this", default=0.005, min=0.0001, precision=4, update=update_projection)
     # bpy.types.Scene.smooth_factor = bpy.props.FloatProperty(name="Smooth Factor", description="Smooth factor", default=2.0)
     # bpy.types.Scene.smooth_iterations = bpy.props.IntProperty(name="Smooth Iterations", description="Smooth iterations", default=20)
 
-    bpy.types.Scene.curve_depth = bpy.props.FloatProperty(name="Curve Depth", description="Curve depth", default=0.05, update=update_property)
-    bpy.types.Scene.curve_extrude = bpy.props.FloatProperty(name="Curve Extrude", description="Curve extrude", default=0.0, update=update_property)
-    bpy.types.Scene.curve_cyclic = bpy.props.BoolProperty(name="Curve Cyclic", description="Curve cyclic", default=False, update=update_property)
+    bpy.types.Scene.curve_depth = bpy.props.FloatProperty(name="Curve Depth", description="Curve depth", default=0.05, update=update_curve_params)
+    bpy.types.Scene.curve_extrude = bpy.props.FloatProperty(name="Curve Extrude", description="Curve extrude", default=0.0, update=update_curve_params)
+    # the closing segment is sampled, refined and routed only for closed splines, so cyclic goes through attach
+    bpy.types.Scene.curve_cyclic = bpy.props.BoolProperty(name="Curve Cyclic", description="Close every spline; off keeps each spline's own cyclic flag", default=False, update=update_projection)
+
+    bpy.app.handlers.depsgraph_update_post.append(_drop_edited_meshes)
+    bpy.app.handlers.load_pre.append(_clear_projectors)
 
 def unregister():
     bpy.utils.unregister_class(OBJECT_OT_rope_attacher)
     bpy.utils.unregister_class(OBJECT_PT_rope_attacher)
+    bpy.utils.unregister_class(OBJECT_OT_rope_attacher_batch)
 
     del bpy.types.Scene.curve_obj
     del bpy.types.Scene.mesh_obj
+    del bpy.types.Scene.attach_tolerance
+    del bpy.types.Scene.curve_collection
+    del bpy.types.Scene.attach_mode
+
+    bpy.app.handlers.depsgraph_update_post.remove(_drop_edited_meshes)
+    bpy.app.handlers.load_pre.remove(_clear_projectors)
+    _projectors.clear()
+    _attachments.clear()
+    ku.release_scratch_pool()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
@@ -1,7 +1,11 @@
 import bpy
 import bmesh
+import mathutils
+import numpy as np
+import os
 import time 
-from mathutils import Vector, kdtree
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import KrusUtilities as ku
 
@@ -10,143 +14,427 @@ class OT_rope_wrap(bpy.types.Operator):
     bl_label = "Rope Wrap"
     bl_options = {'REGISTER', 'UNDO'}
 
+    @ku.profiled
     def execute(self, context):
+        timer = ku.StageTimer(self.bl_label)
+        curve_obj, problem = build_preview(context, timer)
+        if curve_obj is None:
+            self.report(*problem)
+            return {'CANCELLED'}
+        self.report({'INFO'}, timer.summary())
+        return {'FINISHED'}
 
-        target_obj = context.scene.target_obj
-        plane_obj = ku.copy_and_link_object(context, context.scene.plane_obj)
-        bevel_offset = context.scene.bevel_offset
-        merge_threshold = context.scene.merge_threshold
-
-        curve_depth = context.scene.curve_depth
-        curve_extrude = context.scene.curve_extrude
-        curve_offset = context.scene.curve_offset
-        # degrees to radians 
-        curve_tilt = context.scene.curve_tilt * 3.14159 / 180
-
-        # select plane_obj
-        bpy.context.view_layer.objects.active = plane_obj
-        plane_obj.select_set(True)
-        bpy.ops.object.make_single_user(object=True, obdata=True)
-
-        # apply rotation and scale 
-        bpy.ops.object.transform_apply(location=False, rotation=True, scale=True)
-
-        # get plane's face normal 
-        bm = bmesh.new()
-        bm.from_mesh(plane_obj.data)
-        bm.verts.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
-        target_face_normal = bm.faces[0].normal # local normal
-        target_face_normal = plane_obj.matrix_world.to_3x3() @ target_face_normal # global normal
-        bm.free()
-
-        # add bool modifier
-        bpy.ops.object.modifier_add(type='BOOLEAN')
-        bpy.context.object.modifiers["Boolean"].operation = 'INTERSECT'
-        bpy.context.object.modifiers["Boolean"].object = target_obj
-        bpy.ops.object.modifier_apply(modifier="Boolean")
-
-        # select plane_obj only 
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.context.view_layer.objects.active = plane_obj
-        plane_obj.select_set(True)
-
-        # convex hull
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        extrude_val = 0.1
-        bpy.ops.mesh.extrude_region_shrink_fatten(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_shrink_fatten={"value":extrude_val, "use_even_offset":False, "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1.1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "release_confirm":False, "use_accurate":False})
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.convex_hull()
-
-        # select face by normal 
-        bm = bmesh.from_edit_mesh(plane_obj.data)
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bm.verts.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
-        rotation_matrix = plane_obj.matrix_world.to_3x3()
-        for face in bm.faces:
-            face_normal = rotation_matrix @ face.normal
-            face.select = face_normal.angle(-target_face_normal) < 0.1
-        
-        bmesh.update_edit_mesh(plane_obj.data)
-        bm.free()
-
-        # filter out the rim 
-        # fill if more than 1 face 
-        bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-        selected_faces = [f for f in bm.faces if f.select]
-        if len(selected_faces) > 1:
-            bpy.ops.mesh.edge_face_add()
-        bm.free()
-        
-        bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='FACE')
-        bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='VERT')
-        bpy.ops.mesh.select_all(action='INVERT')
-        bpy.ops.mesh.delete(type='VERT')
- 
-        # filp normal 
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.flip_normals()
-
-        # bevel 
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.remove_doubles(threshold=merge_threshold)
-        bpy.ops.mesh.bevel(offset=bevel_offset, affect='VERTICES', clamp_overlap=True, segments=2, profile=1)
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.remove_doubles(threshold=merge_threshold/3)
-
-        # convert to curve 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.convert(target='CURVE')
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.curve.select_all(action='SELECT')
-        bpy.ops.curve.spline_type_set(type='NURBS')
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        curve_obj = bpy.context.object
-
-        # curve params 
-        curve_obj.data.dimensions = '3D'
-        bpy.context.object.data.resolution_u = 4
-        curve_obj.data.offset = -curve_depth * 1.1 + curve_offset 
-        curve_obj.data.bevel_depth = curve_depth
-        curve_obj.data.extrude = curve_extrude
-        bpy.ops.object.shade_smooth()
-
-        for spline in curve_obj.data.splines:
-            for point in spline.points:
-                point.tilt = curve_tilt
-
-        bpy.context.object.display_type = 'TEXTURED'
-
-        bpy.ops.object.mode_set(mode='OBJECT')
-        #select context.scene.plane_obj only
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.context.view_layer.objects.active = context.scene.plane_obj
-        context.scene.plane_obj.select_set(True)
 
-        # save curve_obj name 
-        context.scene['curve_obj_name'] = curve_obj.name
+# slice, process the contour and write the preview curve; returns (curve object, None)
+# or (None, (report level, message)) when there is nothing to build. the stages go into timer
+# (and the profiler's current run), it's up to the caller to report them
+def build_preview(context, timer=None):
+    scene = context.scene
+    target_obj = scene.target_obj
+    plane_obj = scene.plane_obj
+    if not (target_obj and plane_obj):
+        return None, ({'ERROR'}, "Pick a plane and a target object first.")
+
+    if timer is None:
+        timer = ku.StageTimer(OT_rope_wrap.bl_label)
+
+    with timer.stage("slicer"):
+        slicer = get_slicer(target_obj, context.evaluated_depsgraph_get(), scene.rope_cache_size)
+
+    # returning to a configuration seen before skips slicing and contour processing
+    with timer.stage("lookup"):
+        frame = plane_frame(plane_obj)
+        key = (target_obj.name, slicer.mesh_hash, slicer.matrix, tuple(map(tuple, plane_obj.matrix_world)),
+               ku.mesh_arrays(plane_obj.data).content_hash(), scene.rope_wrap_mode) + contour_params(scene)
+        contour = cached_contour(key)
+
+    if contour is None:
+        # slice the target's triangles with the plane
+        with timer.stage("slice"):
+            contour = slicer.contour(frame, scene.rope_wrap_mode)
+        if contour is None:
+            return None, ({'WARNING'}, f"{plane_obj.name} doesn't cut {target_obj.name}.")
+
+        # merge, round the corners and resample, on the 2d contour
+        with timer.stage("polyline"):
+            contour = process_contour(contour, contour_params(scene))
+        store_contour(key, contour, scene.rope_cache_size)
+
+    # write the contour straight into the preview curve
+    with timer.stage("curve"):
+        curve_obj = rope_curve_object(context, plane_obj.name + "_copy")
+        origin = frame["origin"]
+        curve_obj.matrix_world = mathutils.Matrix.Translation(origin)
+        write_rope_curve(curve_obj.data, [lift_to_plane(contour, frame) - origin])
+        apply_curve_params(curve_obj, scene)
+
+    # save curve_obj name 
+    scene['curve_obj_name'] = curve_obj.name
+    return curve_obj, None
+
+
+### caches
+
+# slicers by target object name, dropped by _drop_edited_targets when the target's geometry changes.
+# least recently used ones go first once they are over the cache size in MB, like the contours,
+# but the slicer in use always stays
+_slicers = OrderedDict()
+_slicer_stats = {"bytes": 0}
+
+def get_slicer(target_obj, depsgraph, size_mb):
+    slicer = _slicers.get(target_obj.name)
+    if slicer is None or slicer.matrix != tuple(map(tuple, target_obj.matrix_world)):
+        if slicer is not None:
+            _slicer_stats["bytes"] -= _slicers.pop(target_obj.name).nbytes
+        slicer = _slicers[target_obj.name] = TargetSlicer(target_obj, depsgraph)
+        _slicer_stats["bytes"] += slicer.nbytes
+    _slicers.move_to_end(target_obj.name)
+    while len(_slicers) > 1 and _slicer_stats["bytes"] > size_mb * 1024 * 1024:
+        _slicer_stats["bytes"] -= _slicers.popitem(last=False)[1].nbytes
+    return slicer
+
+# processed 2d contours keyed by target, target geometry, both transforms, plane mesh and the
+# geometry parameters; least recently used ones go first once the cache is over its size in MB
+_contours = OrderedDict()
+_contour_stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+def cached_contour(key):
+    contour = _contours.get(key)
+    if contour is None:
+        _contour_stats["misses"] += 1
+        return None
+    _contour_stats["hits"] += 1
+    _contours.move_to_end(key)
+    return contour
+
+def store_contour(key, contour, size_mb):
+    if key in _contours:
+        _contour_stats["bytes"] -= _contours.pop(key).nbytes
+    _contours[key] = contour
+    _contour_stats["bytes"] += contour.nbytes
+    while _contours and _contour_stats["bytes"] > size_mb * 1024 * 1024:
+        _contour_stats["bytes"] -= _contours.popitem(last=False)[1].nbytes
+
+def drop_target(target_name):
+    if target_name in _slicers:
+        _slicer_stats["bytes"] -= _slicers.pop(target_name).nbytes
+    for key in [key for key in _contours if key[0] == target_name]:
+        _contour_stats["bytes"] -= _contours.pop(key).nbytes
+
+def clear_caches():
+    _slicers.clear()
+    _slicer_stats["bytes"] = 0
+    _contours.clear()
+    _contour_stats.update(hits=0, misses=0, bytes=0)
+
+@bpy.app.handlers.persistent
+def _drop_edited_targets(scene, depsgraph):
+    for update in depsgraph.updates:
+        if update.is_updated_geometry and isinstance(update.id, bpy.types.Object):
+            drop_target(update.id.original.name)
+
+@bpy.app.handlers.persistent
+def _clear_caches_on_load(*args):
+    clear_caches()
+
+
+### plane slicing
+
+# world space frame of the plane's first face: origin, normal, in-plane axes u, v (u x v = normal)
+# and the face's extent along u and v
+def plane_frame(plane_obj):
+    mesh = plane_obj.data
+    matrix = plane_obj.matrix_world
+    face = mesh.polygons[0]
+    face_vertices = [matrix @ mesh.vertices[index].co for index in face.vertices]
+
+    normal = (matrix.to_3x3().inverted_safe().transposed() @ face.normal).normalized()
+    u = (face_vertices[1] - face_vertices[0])
+    u = (u - normal * u.dot(normal)).normalized()
+    v = normal.cross(u)
+
+    frame = {
+        "origin": matrix @ face.center,
+        "normal": np.array(normal),
+        "u": np.array(u),
+        "v": np.array(v),
+    }
+    corners = project_to_plane(np.array(face_vertices), frame)
+    frame["extent"] = (corners.min(axis=0), corners.max(axis=0))
+    return frame
+
+def project_to_plane(points, frame):
+    return (points - np.array(frame["origin"])) @ np.stack((frame["u"], frame["v"]), axis=1)
+
+def lift_to_plane(points, frame):
+    return np.array(frame["origin"]) + points[:, :1] * frame["u"] + points[:, 1:2] * frame["v"]
+
+# world space triangles and edges of the target, everything the slicing needs that doesn't
+# depend on the plane
+class TargetSlicer:
+    def __init__(self, target_obj, depsgraph):
+        evaluated = target_obj.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+        try:
+            mesh.calc_loop_triangles()
+            arrays = ku.MeshArrays(mesh)
+            positions = arrays.positions
+            triangles = arrays.read("loop_triangles", "vertices", 3, np.int32).astype(np.int64)
+            self.mesh_hash = arrays.content_hash()
+        finally:
+            evaluated.to_mesh_clear()
+
+        self.matrix = tuple(map(tuple, target_obj.matrix_world))
+        matrix = np.array(self.matrix)
+        self.positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+
+        # unique edges of the triangles, every triangle refers to its three edges
+        pairs = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        keys, self.triangle_edges = np.unique(pairs[:, 0] * len(positions) + pairs[:, 1], return_inverse=True)
+        self.triangle_edges = self.triangle_edges.reshape(-1, 3)
+        self.edges = np.stack(np.divmod(keys, max(len(positions), 1)), axis=1)
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.triangle_edges.nbytes + self.edges.nbytes
+
+    # crossing points of the plane with the triangle edges (world space),
+    # and one segment (pair of crossing point indices) per cut triangle
+    def slice(self, origin, normal):
+        distances = (self.positions - np.asarray(origin)) @ np.asarray(normal)
+        # vertices exactly on the plane count as above, so a triangle is cut across exactly 0 or 2 edges
+        above = distances >= 0.0
+        crossed = above[self.edges[:, 0]] != above[self.edges[:, 1]]
+
+        triangle_crossed = crossed[self.triangle_edges]
+        cut = triangle_crossed.any(axis=1)
+        segments = self.triangle_edges[cut][triangle_crossed[cut]].reshape(-1, 2)
+
+        crossed_edges = np.flatnonzero(crossed)
+        start, end = self.edges[crossed_edges, 0], self.edges[crossed_edges, 1]
+        t = (distances[start] / (distances[start] - distances[end]))[:, None]
+        points = self.positions[start] + t * (self.positions[end] - self.positions[start])
+
+        point_index = np.full(len(self.edges), -1, dtype=np.int64)
+        point_index[crossed_edges] = np.arange(len(crossed_edges))
+        return points, point_index[segments]
+
+    # 2d closed contour (counter-clockwise in the plane's u, v) of the cross section, clamped to
+    # the plane's extent. HULL wraps every piece of the section, SILHOUETTE follows the outline
+    # of the largest piece
+    def contour(self, frame, mode):
+        points, segments = self.slice(frame["origin"], frame["normal"])
+        if len(segments) == 0:
+            return None
+        points = np.clip(project_to_plane(points, frame), *frame["extent"])
+
+        if mode == 'HULL':
+            outline = convex_hull(points)
+        else:
+            chains = stitch_segments(segments)
+            closed = [chain for chain, is_closed in chains if is_closed]
+            outline = max((points[chain] for chain in closed or [chain for chain, _ in chains]), key=lambda polyline: abs(polygon_area(polyline)))
+            if polygon_area(outline) < 0:
+                outline = outline[::-1]
+        return outline if len(outline) >= 3 else None
+
+# chain segments that share points into polylines: [(point indices, closed), ...]
+def stitch_segments(segments):
+    neighbours = {}
+    for index, (start, end) in enumerate(segments.tolist()):
+        neighbours.setdefault(start, []).append(index)
+        neighbours.setdefault(end, []).append(index)
+
+    used = bytearray(len(segments))
+
+    def walk(point, chain):
+        while True:
+            index = next((index for index in neighbours[point] if not used[index]), None)
+            if index is None:
+                return
+            used[index] = 1
+            start, end = segments[index]
+            point = end if start == point else start
+            chain.append(point)
+
+    chains = []
+    for index in range(len(segments)):
+        if used[index]:
+            continue
+        used[index] = 1
+        start, end = segments[index]
+        chain = [start, end]
+        walk(end, chain)
+        if chain[-1] == chain[0]:
+            chains.append((np.array(chain[:-1]), True))
+            continue
+        # open chain, grow it from the other end as well
+        backwards = [start]
+        walk(start, backwards)
+        chains.append((np.array(backwards[:0:-1] + chain), False))
+    return chains
+
+# signed area, positive for counter-clockwise polygons
+def polygon_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+# counter-clockwise convex hull (Andrew's monotone chain)
+def convex_hull(points):
+    points = np.unique(points, axis=0).tolist()
+    if len(points) < 3:
+        return np.array(points)
+
+    def half_hull(ordered):
+        hull = []
+        for point in ordered:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1])
+                                      - (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull
+
+    lower = half_hull(points)
+    upper = half_hull(reversed(points))
+    return np.array(lower[:-1] + upper[:-1])
+
+
+### polyline processing
+
+# weld a closed polyline by distance: a point is dropped while it's within threshold of the last
+# kept point, and kept points at the end within threshold of the first one merge into it
+def weld_polyline(points, threshold):
+    if threshold <= 0 or len(points) < 4:
+        return points
+    coordinates = points.tolist()
+    limit = threshold * threshold
+
+    def close(a, b):
+        return sum((x - y) * (x - y) for x, y in zip(a, b)) < limit
+
+    keep = [0]
+    for index in range(1, len(coordinates)):
+        if not close(coordinates[index], coordinates[keep[-1]]):
+            keep.append(index)
+    # the end of the loop merges into its start
+    while len(keep) > 1 and close(coordinates[keep[-1]], coordinates[0]):
+        keep.pop()
+    welded = points[keep]
+    return welded if len(welded) >= 3 else points
+
+# the scene's contour parameters, read once on the main thread
+def contour_params(scene):
+    return (scene.merge_threshold, scene.bevel_offset, scene.bevel_segments, scene.rope_point_count)
+
+def process_contour(contour, params):
+    merge_threshold, bevel_offset, bevel_segments, point_count = params
+    contour = weld_polyline(contour, merge_threshold)
+    contour = fillet_corners(contour, bevel_offset, bevel_segments)
+    return resample_closed(contour, point_count)
+
+# round every corner with a circular arc of `segments` segments that starts and ends offset along
+# its two edges (offsets clamped to half the edge lengths, like a bevel with clamped overlap).
+# each arc is a rational quadratic bezier with weight cos(turn / 2), exact for circles and a straight
+# line for corners that don't turn
+def fillet_corners(points, offset, segments):
+    if offset <= 0 or segments < 1:
+        return points
+    incoming = points - np.roll(points, 1, axis=0)
+    outgoing = np.roll(incoming, -1, axis=0)
+    incoming_length = np.linalg.norm(incoming, axis=1, keepdims=True)
+    outgoing_length = np.linalg.norm(outgoing, axis=1, keepdims=True)
+    incoming = incoming / np.maximum(incoming_length, 1e-12)
+    outgoing = outgoing / np.maximum(outgoing_length, 1e-12)
+    clamped = np.minimum(offset, np.minimum(incoming_length, outgoing_length) * 0.5)
+
+    start = points - incoming * clamped
+    end = points + outgoing * clamped
+    # cos(turn / 2) from cos(turn) = incoming . outgoing
+    weight = np.sqrt(np.clip(1.0 + np.einsum("ij,ij->i", incoming, outgoing), 0.0, 2.0) * 0.5)[:, None, None]
+
+    t = np.linspace(0.0, 1.0, segments + 1)[None, :, None]
+    b0, b1, b2 = (1 - t) ** 2, 2 * t * (1 - t) * weight, t ** 2
+    arcs = (b0 * start[:, None] + b1 * points[:, None] + b2 * end[:, None]) / (b0 + b1 + b2)
+    return arcs.reshape(-1, 2)
+
+# count points evenly spaced along a closed polyline, starting at its first point
+def resample_closed(points, count):
+    closed = np.concatenate((points, points[:1]))
+    arc_length = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(closed, axis=0), axis=1))))
+    samples = np.linspace(0.0, arc_length[-1], count, endpoint=False)
+    return np.stack([np.interp(samples, arc_length, closed[:, axis]) for axis in range(closed.shape[1])], axis=1)
+
+
+### curve output
+
+# curve object by name from the scratch pool, reused between runs.
+# keep for outputs, which stay in the file when the pool is released
+def rope_curve_object(context, name, keep=False):
+    curve_obj = ku.scratch_pool.acquire_new(context, name, 'CURVE', lambda key: bpy.data.curves.new(key, 'CURVE'), keep)
+    curve_obj.display_type = 'TEXTURED'
+    return curve_obj
+
+# one closed NURBS spline per polyline (curve object space), replacing the curve's splines
+def write_rope_curve(curve, polylines):
+    curve.splines.clear()
+    for points in polylines:
+        spline = curve.splines.new('NURBS')
+        spline.points.add(len(points) - 1)
+        coordinates = np.ones((len(points), 4), dtype=np.float32)
+        coordinates[:, :3] = points
+        spline.points.foreach_set("co", coordinates.ravel())
+        spline.use_cyclic_u = True
+        spline.use_smooth = True
+
+def apply_curve_params(curve_obj, scene):
+    curve_depth = scene.curve_depth
+    curve_extrude = scene.curve_extrude
+    curve_offset = scene.curve_offset
+    # degrees to radians 
+    curve_tilt = scene.curve_tilt * 3.14159 / 180
+
+    # curve params 
+    curve = curve_obj.data
+    curve.dimensions = '3D'
+    curve.resolution_u = 4
+    curve.offset = -curve_depth * 1.1 + curve_offset 
+    curve.bevel_depth = curve_depth
+    curve.extrude = curve_extrude
+
+    for spline in curve.splines:
+        spline.points.foreach_set("tilt", np.full(len(spline.points), curve_tilt, dtype=np.float32))
 
-        return {'FINISHED'}
 
 class OT_rope_save(bpy.types.Operator):
     bl_idname = "object.rope_save"
     bl_label = "Save Rope"
     bl_options = {'REGISTER', 'UNDO'}
 
+    @ku.profiled
     def execute(self, context):
-        # execute OT_rope_wrap
-        bpy.ops.object.rope_wrap()
-        # rename curve_obj
-        curve_obj = bpy.data.objects[context.scene['curve_obj_name']]
+        # build the preview curve
+        curve_obj, problem = build_preview(context)
+        if curve_obj is None:
+            self.report(*problem)
+            return {'CANCELLED'}
+        # the baked rope is the user's, out of the scratch pool, and renamed
+        ku.scratch_pool.detach(curve_obj)
         timestamp = str(int(time.time()))
         curve_obj.name += "_" + timestamp
-        
+
+        if context.scene.rope_bake_mode == 'PARAMETRIC':
+            start = time.perf_counter()
+            mesh_obj = bake_rope_mesh(context, curve_obj, _DISSOLVE_ANGLE)
+            if mesh_obj is not None:
+                self.report({'INFO'}, f"Baked {mesh_obj.name}: {len(mesh_obj.data.polygons)} faces in {(time.perf_counter() - start) * 1000:.1f}ms")
+                return {'FINISHED'}
+            self.report({'WARNING'}, "The rope isn't a closed tube, falling back to the legacy bake.")
+
+        self.legacy_bake(curve_obj)
+        return {'FINISHED'}
+
+    # convert, unwrap with follow active quads and dissolve co-planar faces with operators
+    def legacy_bake(self, curve_obj):
         # select curve_obj
         bpy.ops.object.select_all(action='DESELECT')
         bpy.context.view_layer.objects.active = curve_obj
@@ -176,8 +464,224 @@ class OT_rope_save(bpy.types.Operator):
         bpy.context.object.modifiers["Decimate"].angle_limit = 0.0872665
         bpy.ops.object.modifier_apply(modifier="Decimate")
 
+
+# rings are dissolved until the rope has turned by this much (radians), like the legacy decimate
+_DISSOLVE_ANGLE = 0.0872665
+
+# a bevelled cyclic curve evaluates to a closed grid, ring after ring of profile points.
+# returns its positions as (rings, profile points, 3), or None when the curve isn't such a tube
+def curve_tube_grid(curve_obj, depsgraph):
+    evaluated = curve_obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        positions = ku.read_array(mesh.vertices, "co", 3)
+        edges = ku.read_array(mesh.edges, "vertices", 2, np.int32).astype(np.int64)
+        polygon_count = len(mesh.polygons)
+    finally:
+        evaluated.to_mesh_clear()
+
+    # around the profile neighbours differ by 1, along the rope by the profile size
+    steps = np.abs(edges[:, 0] - edges[:, 1])
+    counts = np.bincount(steps)
+    if len(counts) < 3:
+        return None
+    profile = int(counts[2:].argmax()) + 2
+    rings = len(positions) // profile
+    if rings < 3 or rings * profile != len(positions) or polygon_count != rings * profile:
+        return None
+    if not np.isin(steps, (1, profile - 1, profile, (rings - 1) * profile)).all():
+        return None
+    return positions.reshape(rings, profile, 3)
+
+# rings kept after dissolving every ring where the rope has turned by less than angle_limit since
+# the last kept ring
+def turning_rings(centers, angle_limit):
+    directions = np.roll(centers, -1, axis=0) - centers
+    directions /= np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+    turns = np.arccos(np.clip(np.einsum("ij,ij->i", directions, np.roll(directions, 1, axis=0)), -1.0, 1.0))
+
+    keep = [0]
+    turned = 0.0
+    for ring, turn in enumerate(turns[1:].tolist(), 1):
+        turned += turn
+        if turned >= angle_limit:
+            keep.append(ring)
+            turned = 0.0
+    return np.array(keep)
+
+# quads of a closed tube grid (rings, profile points, 3) with U along the rope's length and V around
+# the profile, both in units of the profile's perimeter so the texels stay square
+def tube_topology(grid):
+    rings, profile = grid.shape[:2]
+    centers = grid.mean(axis=1)
+
+    closed_profile = np.concatenate((grid[0], grid[0][:1]))
+    v = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(closed_profile, axis=0), axis=1))))
+    perimeter = max(v[-1], 1e-12)
+    closed_centers = np.concatenate((centers, centers[:1]))
+    u = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(closed_centers, axis=0), axis=1)))) / perimeter
+    v /= perimeter
+
+    ring, point = np.meshgrid(np.arange(rings), np.arange(profile), indexing="ij")
+    ring, point = ring.ravel(), point.ravel()
+    next_ring, next_point = (ring + 1) % rings, (point + 1) % profile
+    loop_vertices = np.stack((ring * profile + point, ring * profile + next_point,
+                              next_ring * profile + next_point, next_ring * profile + point), axis=1)
+    # seams get their own uvs through the unwrapped ring + 1 / point + 1
+    uvs = np.stack((np.stack((u[ring], v[point]), axis=1), np.stack((u[ring], v[point + 1]), axis=1),
+                    np.stack((u[ring + 1], v[point + 1]), axis=1), np.stack((u[ring + 1], v[point]), axis=1)), axis=1)
+
+    # face the quads outwards
+    positions = grid.reshape(-1, 3)
+    first = positions[loop_vertices[0]]
+    if np.dot(np.cross(first[1] - first[0], first[3] - first[0]), first[0] - centers[0]) < 0:
+        loop_vertices = loop_vertices[:, ::-1]
+        uvs = uvs[:, ::-1]
+    return loop_vertices, uvs
+
+# replace a rope curve object by a mesh object built straight from its evaluated tube
+def bake_rope_mesh(context, curve_obj, angle_limit):
+    grid = curve_tube_grid(curve_obj, context.evaluated_depsgraph_get())
+    if grid is None:
+        return None
+    grid = grid[turning_rings(grid.mean(axis=1), angle_limit)]
+    loop_vertices, uvs = tube_topology(grid)
+
+    name = curve_obj.name
+    mesh = ku.fill_mesh(bpy.data.meshes.new(name), grid.reshape(-1, 3), loop_vertices.ravel(),
+                        np.arange(len(loop_vertices)) * 4, uvs.reshape(-1, 2))
+    mesh.polygons.foreach_set("use_smooth", np.ones(len(mesh.polygons), dtype=bool))
+    for material in curve_obj.data.materials:
+        mesh.materials.append(material)
+
+    mesh_obj = bpy.data.objects.new(name, mesh)
+    mesh_obj.matrix_world = curve_obj.matrix_world
+    for collection in curve_obj.users_collection:
+        collection.objects.link(mesh_obj)
+
+    curve = curve_obj.data
+    bpy.data.objects.remove(curve_obj, do_unlink=True)
+    if curve.users == 0:
+        bpy.data.curves.remove(curve)
+    mesh_obj.name = name
+    return mesh_obj
+
+
+class OT_rope_wrap_batch(bpy.types.Operator):
+    bl_idname = "object.rope_wrap_batch"
+    bl_label = "Rope Wrap - Batch"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @ku.profiled
+    def execute(self, context):
+        scene = context.scene
+        target_obj = scene.target_obj
+        if target_obj is None:
+            self.report({'ERROR'}, "Pick a target object first.")
+            return {'CANCELLED'}
+
+        start = time.perf_counter()
+        timer = ku.StageTimer(self.bl_label)
+
+        # frames of every plane, then the target side once for all of them
+        with timer.stage("setup"):
+            if scene.rope_batch_source == 'COLLECTION':
+                if scene.rope_plane_collection is None:
+                    self.report({'ERROR'}, "Pick a collection of planes first.")
+                    return {'CANCELLED'}
+                planes = [obj for obj in scene.rope_plane_collection.all_objects if obj.type == 'MESH' and obj.data.polygons]
+                names = [obj.name for obj in planes]
+                frames = [plane_frame(obj) for obj in planes]
+            else:
+                frames = generated_frames(target_obj, scene)
+                names = [f"{target_obj.name}_{index:03d}" for index in range(len(frames))]
+            slicer = get_slicer(target_obj, context.evaluated_depsgraph_get(), scene.rope_cache_size)
+
+        # contours only read the shared slicer, so they run side by side
+        mode = scene.rope_wrap_mode
+        params = contour_params(scene)
+
+        def rope(frame):
+            contour = slicer.contour(frame, mode)
+            return None if contour is None else lift_to_plane(process_contour(contour, params), frame)
+
+        with timer.stage("contours"):
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+                ropes = list(pool.map(rope, frames))
+        built = [(name, frame, points) for name, frame, points in zip(names, frames, ropes) if points is not None]
+        if not built:
+            self.report({'WARNING'}, f"None of the planes cut {target_obj.name}.")
+            return {'CANCELLED'}
+
+        with timer.stage("curves"):
+            # batch ropes are outputs: pooled so a rerun refills them, but kept on unregister
+            if scene.rope_batch_output == 'JOINED':
+                curve_obj = rope_curve_object(context, target_obj.name + "_ropes", keep=True)
+                curve_obj.matrix_world = mathutils.Matrix.Identity(4)
+                write_rope_curve(curve_obj.data, [points for _, _, points in built])
+                apply_curve_params(curve_obj, scene)
+            else:
+                current = set()
+                for name, frame, points in built:
+                    curve_obj = rope_curve_object(context, name + "_rope", keep=True)
+                    curve_obj[_BATCH_TAG] = target_obj.name
+                    curve_obj.matrix_world = mathutils.Matrix.Translation(frame["origin"])
+                    write_rope_curve(curve_obj.data, [points - np.array(frame["origin"])])
+                    apply_curve_params(curve_obj, scene)
+                    current.add(curve_obj.name)
+                remove_batch_extras(target_obj.name, current)
+
+        elapsed = time.perf_counter() - start
+        skipped = len(frames) - len(built)
+        self.report({'INFO'}, f"{len(built)} ropes in {elapsed:.2f}s, {elapsed / len(built) * 1000:.1f}ms per rope"
+                    + (f", {skipped} planes missed the target" if skipped else "") + " | " + timer.summary())
         return {'FINISHED'}
 
+
+# custom property on the separate ropes of a batch, holding the target's name
+_BATCH_TAG = "rope_batch_target"
+
+# separate ropes an earlier batch of the same target made and this one didn't, e.g. after lowering
+# rope_batch_count; objects the scratch pool didn't make are never removed
+def remove_batch_extras(target_name, current):
+    for obj in [obj for obj in bpy.data.objects if obj.get(_BATCH_TAG) == target_name and obj.name not in current]:
+        ku.scratch_pool.discard(obj)
+
+# frame of a square plane through origin, facing normal
+def axis_frame(origin, normal, half_size):
+    normal = mathutils.Vector(normal).normalized()
+    u = normal.cross(mathutils.Vector((0.0, 0.0, 1.0)) if abs(normal.z) < 0.9 else mathutils.Vector((1.0, 0.0, 0.0))).normalized()
+    return {
+        "origin": mathutils.Vector(origin),
+        "normal": np.array(normal),
+        "u": np.array(u),
+        "v": np.array(normal.cross(u)),
+        "extent": (np.full(2, -half_size), np.full(2, half_size)),
+    }
+
+# rope_batch_count planes spaced along one of the target's local axes around its bounding box
+# center, each shifted and tilted by a seeded random jitter
+def generated_frames(target_obj, scene):
+    matrix = target_obj.matrix_world
+    corners = np.array([matrix @ mathutils.Vector(corner) for corner in target_obj.bound_box])
+    center = corners.mean(axis=0)
+    half_size = np.linalg.norm(corners.max(axis=0) - corners.min(axis=0))
+
+    axis = np.array(matrix.to_3x3().col["XYZ".index(scene.rope_batch_axis)].normalized())
+    count = scene.rope_batch_count
+    rng = np.random.default_rng(scene.rope_batch_seed)
+    offsets = (np.arange(count) - (count - 1) / 2) * scene.rope_batch_spacing
+    offsets += rng.uniform(-1.0, 1.0, count) * scene.rope_batch_jitter
+    tilts = rng.normal(size=(count, 3)) * np.radians(scene.rope_batch_tilt_jitter)
+
+    frames = []
+    for offset, tilt in zip(offsets, tilts):
+        # small random rotation of the axis, tilt is a rotation vector
+        normal = axis + np.cross(tilt, axis)
+        frames.append(axis_frame(center + axis * offset, normal, half_size))
+    return frames
+
+
 class PT_rope_wrap(bpy.types.Panel):
     bl_label = "Rope Wrap Panel"
     bl_idname = "PT_rope_wrap"
@@ -192,11 +696,24 @@ class PT_rope_wrap(bpy.types.Panel):
         box0.label(text="Input Objects")
         box0.prop(context.scene, "plane_obj")
         box0.prop(context.scene, "target_obj")
+        if _preview_problem:
+            box0.label(text=_preview_problem, icon='ERROR')
 
         box1 = layout.box()
         box1.label(text="Parameters")
+        box1.prop(context.scene, "rope_wrap_mode")
         box1.prop(context.scene, "merge_threshold")
         box1.prop(context.scene, "bevel_offset")
+        box1.prop(context.scene, "bevel_segments")
+        box1.prop(context.scene, "rope_point_count")
+
+        box_cache = layout.box()
+        box_cache.label(text="Contour Cache")
+        box_cache.prop(context.scene, "rope_cache_size")
+        box_cache.label(text=f"{len(_contours)} contours, {_contour_stats['bytes'] / (1024 * 1024):.2f} MB")
+        box_cache.label(text=f"{len(_slicers)} slicers, {_slicer_stats['bytes'] / (1024 * 1024):.2f} MB")
+        box_cache.label(text=f"{_contour_stats['hits']} hits / {_contour_stats['misses']} misses")
+        box_cache.label(text="Scratch objects: " + ku.scratch_pool.summary())
 
         box2 = layout.box()
         box2.label(text="Curve Params")
@@ -210,33 +727,152 @@ class PT_rope_wrap(bpy.types.Panel):
         layout.separator()
         layout.operator("object.rope_wrap", text="Rope Wrap - Preview")
         layout.operator("object.rope_save", text="Rope Wrap - Bake")
-
-def update_property(self, context):
-    bpy.ops.object.rope_wrap()
+        layout.prop(context.scene, "rope_bake_mode")
+
+        box_batch = layout.box()
+        box_batch.label(text="Batch")
+        box_batch.prop(context.scene, "rope_batch_source")
+        if context.scene.rope_batch_source == 'COLLECTION':
+            box_batch.prop(context.scene, "rope_plane_collection")
+        else:
+            box_batch.prop(context.scene, "rope_batch_axis")
+            box_batch.prop(context.scene, "rope_batch_count")
+            box_batch.prop(context.scene, "rope_batch_spacing")
+            box_batch.prop(context.scene, "rope_batch_jitter")
+            box_batch.prop(context.scene, "rope_batch_tilt_jitter")
+            box_batch.prop(context.scene, "rope_batch_seed")
+        box_batch.prop(context.scene, "rope_batch_output")
+        box_batch.operator("object.rope_wrap_batch")
+
+### live preview
+
+# geometry properties (mode, merge threshold, bevel offset and segments, point count) need a new contour and use
+# update_geometry, curve properties (depth, extrude, offset, tilt) only change the existing curve
+# datablock and use update_curve
+
+# while a slider is dragged, rebuild at most once per interval with the latest values
+_PREVIEW_INTERVAL = 0.1
+
+def _preview_curve_obj(scene):
+    curve_obj = bpy.data.objects.get(scene.get('curve_obj_name', ""))
+    return curve_obj if curve_obj is not None and curve_obj.type == 'CURVE' else None
+
+# why the last live rebuild built nothing, shown in the panel instead of a report (there is no operator)
+_preview_problem = None
+
+# a profiled run of its own, so its stages land in the profiler rather than on stdout
+def _rebuild_preview():
+    global _preview_problem
+    with ku.profiled_run(OT_rope_wrap.bl_idname + ".preview"):
+        curve_obj, problem = build_preview(bpy.context)
+    _preview_problem = problem[1] if curve_obj is None else None
+    # one-shot, the next update arms the timer again
+    return None
+
+# coalesce geometry updates: the first change arms a timer, later changes within the interval
+# are picked up by the same rebuild
+def update_geometry(self, context):
+    if not bpy.app.timers.is_registered(_rebuild_preview):
+        bpy.app.timers.register(_rebuild_preview, first_interval=_PREVIEW_INTERVAL)
+
+# curve properties edit the preview curve in place, without slicing again
+def update_curve(self, context):
+    curve_obj = _preview_curve_obj(context.scene)
+    if curve_obj is None:
+        update_geometry(self, context)
+    else:
+        apply_curve_params(curve_obj, context.scene)
 
 def register():
     bpy.utils.register_class(OT_rope_wrap)
     bpy.utils.register_class(PT_rope_wrap)
     bpy.utils.register_class(OT_rope_save)
+    bpy.utils.register_class(OT_rope_wrap_batch)
 
     bpy.types.Scene.plane_obj = bpy.props.PointerProperty(type=bpy.types.Object, name="Plane", description="Plane to wrap around the target", poll=lambda self, obj: obj.type == 'MESH')
     bpy.types.Scene.target_obj = bpy.props.PointerProperty(type=bpy.types.Object, name="Target", description="Object to wrap the plane around", poll=lambda self, obj: obj.type == 'MESH')
 
-    bpy.types.Scene.merge_threshold = bpy.props.FloatProperty(name="Merge Threshold", default=0.01, description="Threshold for merging vertices", precision=5, min=0, update=update_property)
-    bpy.types.Scene.bevel_offset = bpy.props.FloatProperty(name="Bevel Offset", default=0.1, description="Offset of the bevel modifier", precision=5, min=0, update=update_property)
-
-    bpy.types.Scene.curve_depth = bpy.props.FloatProperty(name="Curve Depth", default=0.1, description="Depth of the curve", min=0, precision=5, update=update_property)
-    bpy.types.Scene.curve_offset = bpy.props.FloatProperty(name="Curve Offset", default=0.1, precision=5, description="Offset of the curve", update=update_property)
-    bpy.types.Scene.curve_tilt = bpy.props.IntProperty(name="Curve Tilt", default=90, step=1, description="Tilt of the curve", update=update_property)
-    bpy.types.Scene.curve_extrude = bpy.props.FloatProperty(name="Curve Extrude", default=0.1, description="Extrude of the curve", precision=5, min = 0, update=update_property)
+    bpy.types.Scene.rope_wrap_mode = bpy.props.EnumProperty(
+        name="Wrap",
+        items=[
+            ('HULL', "Convex Hull", "Wrap around the convex hull of the cross section"),
+            ('SILHOUETTE', "Silhouette", "Follow the outline of the largest piece of the cross section"),
+        ],
+        default='HULL',
+        update=update_geometry
+    )
+    bpy.types.Scene.merge_threshold = bpy.props.FloatProperty(name="Merge Threshold", default=0.01, description="Threshold for merging vertices", precision=5, min=0, update=update_geometry)
+    bpy.types.Scene.bevel_offset = bpy.props.FloatProperty(name="Bevel Offset", default=0.1, description="Offset of the bevel modifier", precision=5, min=0, update=update_geometry)
+
+    bpy.types.Scene.bevel_segments = bpy.props.IntProperty(name="Bevel Segments", default=4, min=1, max=32, description="Segments of each rounded corner", update=update_geometry)
+    bpy.types.Scene.rope_point_count = bpy.props.IntProperty(name="Points", default=128, min=4, max=4096, description="Points of the rope curve, evenly spaced along the contour", update=update_geometry)
+    bpy.types.Scene.rope_cache_size = bpy.props.FloatProperty(name="Cache Size (MB)", default=64, min=0, description="Memory for remembered contours, and separately for target slicers, least recently used ones are dropped first")
+
+    bpy.types.Scene.rope_bake_mode = bpy.props.EnumProperty(
+        name="Bake",
+        items=[
+            ('PARAMETRIC', "Parametric", "Build the mesh and its uvs straight from the rope's tube"),
+            ('LEGACY', "Legacy", "Convert, unwrap and decimate with operators"),
+        ],
+        default='PARAMETRIC'
+    )
+    bpy.types.Scene.rope_batch_source = bpy.props.EnumProperty(
+        name="Planes",
+        items=[
+            ('COLLECTION', "Collection", "Wrap every plane of a collection"),
+            ('GENERATED', "Generated", "Wrap planes spaced along an axis of the target"),
+        ],
+        default='GENERATED'
+    )
+    bpy.types.Scene.rope_plane_collection = bpy.props.PointerProperty(type=bpy.types.Collection, name="Plane Collection", description="Planes to wrap around the target")
+    bpy.types.Scene.rope_batch_axis = bpy.props.EnumProperty(name="Axis", items=[('X', "X", ""), ('Y', "Y", ""), ('Z', "Z", "")], default='Z', description="Local axis of the target the planes are spaced along")
+    bpy.types.Scene.rope_batch_count = bpy.props.IntProperty(name="Count", default=10, min=1, max=1000, description="Number of generated planes")
+    bpy.types.Scene.rope_batch_spacing = bpy.props.FloatProperty(name="Spacing", default=0.1, min=0, precision=4, description="Distance between generated planes")
+    bpy.types.Scene.rope_batch_jitter = bpy.props.FloatProperty(name="Jitter", default=0.0, min=0, precision=4, description="Random shift of each generated plane along the axis")
+    bpy.types.Scene.rope_batch_tilt_jitter = bpy.props.FloatProperty(name="Tilt Jitter", default=0.0, min=0, max=45, description="Random tilt of each generated plane, in degrees")
+    bpy.types.Scene.rope_batch_seed = bpy.props.IntProperty(name="Seed", default=0, min=0, description="Seed of the jitter")
+    bpy.types.Scene.rope_batch_output = bpy.props.EnumProperty(
+        name="Output",
+        items=[
+            ('JOINED', "Joined", "One curve object with a spline per rope"),
+            ('SEPARATE', "Separate", "One curve object per rope"),
+        ],
+        default='JOINED'
+    )
+
+    bpy.app.handlers.depsgraph_update_post.append(_drop_edited_targets)
+    bpy.app.handlers.load_pre.append(_clear_caches_on_load)
+
+    bpy.types.Scene.curve_depth = bpy.props.FloatProperty(name="Curve Depth", default=0.1, description="Depth of the curve", min=0, precision=5, update=update_curve)
+    bpy.types.Scene.curve_offset = bpy.props.FloatProperty(name="Curve Offset", default=0.1, precision=5, description="Offset of the curve", update=update_curve)
+    bpy.types.Scene.curve_tilt = bpy.props.IntProperty(name="Curve Tilt", default=90, step=1, description="Tilt of the curve", update=update_curve)
+    bpy.types.Scene.curve_extrude = bpy.props.FloatProperty(name="Curve Extrude", default=0.1, description="Extrude of the curve", precision=5, min = 0, update=update_curve)
 
 def unregister():
     bpy.utils.unregister_class(OT_rope_wrap)
     bpy.utils.unregister_class(PT_rope_wrap)
     bpy.utils.unregister_class(OT_rope_save)
+    bpy.utils.unregister_class(OT_rope_wrap_batch)
 
     del bpy.types.Scene.plane_obj
     del bpy.types.Scene.target_obj
+    del bpy.types.Scene.rope_wrap_mode
+    del bpy.types.Scene.rope_cache_size
+    del bpy.types.Scene.bevel_segments
+    del bpy.types.Scene.rope_point_count
+    for name in ("source", "axis", "count", "spacing", "jitter", "tilt_jitter", "seed", "output"):
+        delattr(bpy.types.Scene, "rope_batch_" + name)
+    del bpy.types.Scene.rope_plane_collection
+    del bpy.types.Scene.rope_bake_mode
+
+    bpy.app.handlers.depsgraph_update_post.remove(_drop_edited_targets)
+    bpy.app.handlers.load_pre.remove(_clear_caches_on_load)
+    clear_caches()
+    ku.release_mesh_arrays()
+    ku.release_scratch_pool()
+
+    if bpy.app.timers.is_registered(_rebuild_preview):
+        bpy.app.timers.unregister(_rebuild_preview)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 import bpy
-import bmesh
 import mathutils
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from mathutils import kdtree
+import numpy as np
+
+import KrusUtilities as ku
 
 ### variables
 _bl_idname = "object.smooth_normal_to_uv_operator"
@@ -12,157 +19,394 @@ class SmoothNormalToUVOperator(bpy.types.Operator):
     bl_idname = _bl_idname
     bl_label = _bl_label
 
-    def calculate_tangent_space(mesh):
-        mesh.calc_tangents()
-        tangents = [None] * len(mesh.loops)
-        bitangents = [None] * len(mesh.loops)
-        normals = [None] * len(mesh.loops)
-
-        for loop in mesh.loops:
-            tangents[loop.index] = loop.tangent
-            bitangents[loop.index] = loop.bitangent
-            normals[loop.index] = loop.normal
+    # check the bulk path against the per-loop reference (slow, for debugging)
+    verify: bpy.props.BoolProperty(name="Verify", default=False)
 
-        return tangents, bitangents, normals
+    def collect_targets(self, context, source_object):
+        wm = context.window_manager
+        if wm.smooth_normal_targets == 'SELECTED':
+            objects = context.selected_objects
+        elif wm.smooth_normal_targets == 'COLLECTION':
+            objects = wm.target_collection.all_objects if wm.target_collection else []
+        else:
+            objects = [wm.target_object] if wm.target_object else []
 
+        # objects sharing one mesh datablock only need one bake
+        targets = {}
+        for obj in objects:
+            if obj.type == 'MESH' and obj != source_object:
+                targets.setdefault(obj.data.as_pointer(), obj)
+        return list(targets.values())
 
+    @ku.profiled
     def execute(self, context):
         ### get inputs from property
-        source_object = bpy.context.window_manager.source_object
-        target_object = bpy.context.window_manager.target_object
-
-        # Ensure the target object has 3 UV maps
-        if target_object and target_object.type == 'MESH':
-            mesh = target_object.data
-            while len(mesh.uv_layers) < 3:
-                mesh.uv_layers.new(name=f"UVMap_{len(mesh.uv_layers) + 1}")
-            print(f"Target object now has {len(mesh.uv_layers)} UV maps.")
-        else:
-            print("No valid mesh object selected.")
-
-        # Save original normals of the target object
-        if target_object and target_object.type == 'MESH':
-            bm_original = bmesh.new()
-            bm_original.from_mesh(mesh)
-            
-            if "original_normals" not in bm_original.verts.layers.float_vector:
-                original_normals_layer = bm_original.verts.layers.float_vector.new("original_normals")
-            else:
-                original_normals_layer = bm_original.verts.layers.float_vector["original_normals"]
-            
-            for vert in bm_original.verts:
-                vert[original_normals_layer] = vert.normal
-            
-            print(f"Save original normals of {target_object.name} to bm_original.")
-        else:
-            print("No valid mesh object selected.")
-
-        # Apply Data Transfer Modifier to the target object
-        if source_object and target_object:
-            data_transfer_mod = target_object.modifiers.new(name="DataTransfer", type='DATA_TRANSFER')
-            data_transfer_mod.object = source_object
-            data_transfer_mod.use_loop_data = True
-            data_transfer_mod.data_types_loops = {'CUSTOM_NORMAL'}
-            data_transfer_mod.loop_mapping = 'NEAREST_POLYNOR'
-            # apply data_transfer_mod
-            bpy.ops.object.modifier_apply(modifier=data_transfer_mod.name)
-
-        # Save modified normals of the target object
-        if target_object and target_object.type == 'MESH':
-            bm_modified = bmesh.new()
-            bm_modified.from_mesh(mesh)
-            
-            if "modified_normals" not in bm_modified.verts.layers.float_vector:
-                modified_normals_layer = bm_modified.verts.layers.float_vector.new("modified_normals")
-            else:
-                modified_normals_layer = bm_modified.verts.layers.float_vector["modified_normals"]
-            
-            for vert in bm_modified.verts:
-                vert[modified_normals_layer] = vert.normal
-            
-            print(f"Save modified normals of {target_object.name} to bm_modified.")
-        else:
-            print("No valid mesh object selected.")
-
-        # Recover original normals of the target object
-        if target_object and target_object.type == 'MESH' and bm_original:
-            bm_original.to_mesh(mesh)
-            target_object.data.update()
-
-            print(f"Restore original normals of {target_object.name}.")
-        else:
-            print("No valid mesh object selected or bm_original is None.")
-
-        if target_object and target_object.type == 'MESH':
-
-            mesh = target_object.data
-
-            # Ensure the mesh has a vertex color layer
-            if not mesh.vertex_colors:
-                mesh.vertex_colors.new()
-
-            # Access third uv of target object
-            uv_layer = mesh.uv_layers[2]
-
-            # get first uv map name of target object
-            uv_map_name = mesh.uv_layers[0].name
-
-            # Calculate tangents using the Mesh object
-            mesh.calc_tangents(uvmap=uv_map_name)
-            print(f"uv_map_name {uv_map_name}")
-
-            tangents = [None] * len(mesh.loops)
-            bitangents = [None] * len(mesh.loops)
-            normals = [None] * len(mesh.loops)
-            bitangent_signs = [None] * len(mesh.loops)
-
-            print(f"mesh.loops: {len(mesh.loops)}")
-
-            for loop in mesh.loops:
-
-                tangents[loop.index] = loop.tangent.normalized()
-                bitangents[loop.index] = loop.bitangent.normalized()
-                normals[loop.index] = loop.normal.normalized()
-                bitangent_signs[loop.index] = loop.bitangent_sign
-
-            bm_modified.verts.ensure_lookup_table()
-            bm_modified.faces.ensure_lookup_table()
-
-            print (f"bm_modified.faces: {len(bm_modified.faces)}")
-            for face in bm_modified.faces:
-                print(f"face.loops: {len(face.loops)}")
-                for loop in face.loops:
-                    vert_index = loop.vert.index
-                    print(f"vert_index: {vert_index}")
-                    
-                    normal = loop.vert.normal
-
-                    # # Access tangent space basis
-                    tangent = tangents[loop.index]
-                    normal_basis = normals[loop.index]
-                    # bitangent = normal_basis.cross(tangent) * bitangent_signs[loop.index]
-                    bitangent = bitangents[loop.index]
-
-                    # transform
-                    transformed_normal = mathutils.Vector((0, 0, 0))
-                    transformed_normal.x = normal.dot(tangent)
-                    transformed_normal.y = normal.dot(normal_basis)
-                    transformed_normal.z = normal.dot(bitangent)
-                    transformed_normal.normalize()
-
-                    # Store transformed_normal in uv_layer
-                    uv_layer.data[loop.index].uv = transformed_normal.xy
-                    print(f"uv_layer.data length {len(uv_layer.data)}")
-
-                    print(f"loop.index: {loop.index}")
+        wm = context.window_manager
+        source_object = wm.source_object
+        targets = self.collect_targets(context, source_object)
+
+        if not (source_object and targets):
+            self.report({'ERROR'}, "No valid mesh object selected.")
+            return {'CANCELLED'}
+
+        timer = ku.StageTimer(self.bl_label)
+        wall_start = time.perf_counter()
+
+        # Build or reuse the source lookup once for every target
+        with timer.stage("source_index"):
+            source_index = get_source_index(source_object, context.evaluated_depsgraph_get())
+        if source_index is None:
+            self.report({'ERROR'}, f"{source_object.name} has no faces to transfer normals from.")
+            return {'CANCELLED'}
+
+        # Blender data is only read and written on the main thread,
+        # the array math of each target runs on the pool while the next target is read
+        encoding = wm.smooth_normal_encoding
+        uv_index = wm.smooth_normal_uv_index
+        source_inverse = source_object.matrix_world.inverted()
+        results = []
+        with ThreadPoolExecutor(max_workers=wm.smooth_normal_threads) as pool:
+            for target_object in targets:
+                start = time.perf_counter()
+                with timer.stage("read"):
+                    arrays = read_target(target_object.data, uv_index)
+                target_to_source = np.array(source_inverse @ target_object.matrix_world)
+                future = pool.submit(compute_uvs, source_index, arrays, target_to_source, encoding)
+                results.append((target_object, future, time.perf_counter() - start))
+
+            total_loops = 0
+            angular_errors = []
+            for target_object, future, read_time in results:
+                result = future.result()
+                timer.add("compute", result["time"])
+
+                start = time.perf_counter()
+                with timer.stage("write"):
+                    write_uvs(target_object.data, uv_index, result["encoded"])
+                # read, compute and write of this target, without the time it waited for the pool
+                object_time = read_time + result["time"] + time.perf_counter() - start
+
+                loop_count = len(result["encoded"])
+                total_loops += loop_count
+                angular_errors.append(result["angular_error"])
+                self.report({'INFO'}, f"{target_object.name}: {loop_count} loops, {object_time * 1000:.1f}ms, {loop_count / max(object_time, 1e-9):,.0f} loops/sec")
+
+                if self.verify:
+                    self.verify_target(target_object, result["tangent_normals"][:, :2], result["smooth_normals"])
+
+        # round trip error of the chosen encoding over every baked loop
+        angular_errors = np.concatenate(angular_errors)
+        self.report({'INFO'}, f"{encoding}: max angular error {angular_errors.max(initial=0.0):.4f} deg, mean {angular_errors.mean() if len(angular_errors) else 0.0:.4f} deg")
+
+        wall_time = time.perf_counter() - wall_start
+        self.report({'INFO'}, f"{len(targets)} objects, {total_loops} loops, {total_loops / max(wall_time, 1e-9):,.0f} loops/sec | " + timer.summary())
+        return {'FINISHED'}
 
-            print(f"Saved transformed normals of {target_object.name} to the vertex color layer.")
+    def verify_target(self, target_object, uvs, smooth_normals):
+        error = np.abs(uvs - reference_uvs(target_object.data, smooth_normals)).max(initial=0.0)
+        if error > UV_TOLERANCE:
+            self.report({'WARNING'}, f"{target_object.name}: bulk path differs from reference by {error:.2e} (tolerance {UV_TOLERANCE:.0e})")
         else:
-            print("No valid mesh object selected or bm_original is None.")
-
-        bm_original.free()
-        bm_modified.free()
-        return {'FINISHED'}
+            self.report({'INFO'}, f"{target_object.name}: bulk path matches reference, max error {error:.2e}")
+
+
+# uv values of the bulk path stay within this of the per-loop mathutils path
+UV_TOLERANCE = 1e-5
+
+def _normalize(vectors):
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # zero vectors stay zero, like mathutils.Vector.normalize()
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+
+# everything a bake needs from the target mesh, read on the main thread
+def read_target(mesh, uv_index):
+    # Ensure the target object has the uv map to bake into
+    while len(mesh.uv_layers) <= uv_index:
+        mesh.uv_layers.new(name=f"UVMap_{len(mesh.uv_layers) + 1}")
+
+    # Calculate tangents on the first uv map
+    arrays = ku.mesh_arrays(mesh)
+    tangents, bitangents, normals = arrays.tangent_space(mesh.uv_layers[0].name)
+
+    return {
+        "positions": arrays.positions,
+        "loop_vertices": arrays.loop_vertices,
+        "loop_face_normals": read_loop_face_normals(arrays),
+        "tangents": tangents,
+        "bitangents": bitangents,
+        "normals": normals,
+    }
+
+# target independent array math of one bake, safe to run off the main thread
+def compute_uvs(source_index, arrays, target_to_source, encoding):
+    start = time.perf_counter()
+    smooth_normals = source_index.transfer(arrays["positions"], arrays["loop_vertices"], arrays["loop_face_normals"], target_to_source)
+    tangent_normals = transform_to_tangent_space(smooth_normals, arrays["tangents"], arrays["bitangents"], arrays["normals"])
+    encoded = encode_normals(tangent_normals, encoding)
+    return {
+        "smooth_normals": smooth_normals,
+        "tangent_normals": tangent_normals,
+        "encoded": encoded,
+        "angular_error": angular_error(tangent_normals, decode_normals(encoded, encoding)),
+        "time": time.perf_counter() - start,
+    }
+
+# Store encoded normals in the uv map, packed encodings only replace u and keep v
+def write_uvs(mesh, uv_index, encoded):
+    uv_name = mesh.uv_layers[uv_index].name
+    if encoded.ndim == 1:
+        uvs = ku.mesh_arrays(mesh).uvs(uv_name).copy()
+        uvs[:, 0] = encoded
+    else:
+        uvs = encoded
+    ku.write_uvs(mesh, uv_name, uvs)
+    mesh.update()
+
+# project per-loop normals onto (tangent, normal, bitangent) and normalize the result
+def transform_to_tangent_space(loop_normals, tangents, bitangents, normals):
+    basis = np.stack((_normalize(tangents), _normalize(normals), _normalize(bitangents)), axis=1)
+    return _normalize(np.einsum("lij,lj->li", basis, loop_normals))
+
+### encodings of the tangent space normal
+# RAW_XY      x, y as float2, z has to be rebuilt as +sqrt(1 - x^2 - y^2) and its sign is lost
+# OCTAHEDRAL  octahedral map of the unit vector as float2, lossless up to float precision
+# OCT16/OCT8  octahedral map quantized to 8+8 / 4+4 bits and packed into one integer stored in u.
+#             the integer is exact in a float32 channel, decode with
+#             x = floor(u / 2^bits), y = u - x * 2^bits, e = q / (2^bits - 1) * 2 - 1
+_PACKED_BITS = {'OCT16': 8, 'OCT8': 4}
+
+def _sign_not_zero(values):
+    return np.where(values >= 0.0, 1.0, -1.0)
+
+# unit vectors -> points in [-1, 1]^2
+def octahedral_encode(normals):
+    normals = np.asarray(normals, dtype=np.float64)
+    l1_norms = np.abs(normals).sum(axis=1, keepdims=True)
+    projected = np.divide(normals, l1_norms, out=np.zeros_like(normals), where=l1_norms > 0)
+    encoded = projected[:, :2]
+    # fold the lower hemisphere over the diagonals
+    lower = projected[:, 2] < 0.0
+    encoded[lower] = (1.0 - np.abs(encoded[lower][:, ::-1])) * _sign_not_zero(encoded[lower])
+    return encoded
+
+# points in [-1, 1]^2 -> unit vectors
+def octahedral_decode(encoded):
+    encoded = np.asarray(encoded, dtype=np.float64)
+    normals = np.empty((len(encoded), 3))
+    normals[:, :2] = encoded
+    normals[:, 2] = 1.0 - np.abs(encoded).sum(axis=1)
+    fold = np.clip(-normals[:, 2], 0.0, None)[:, None]
+    normals[:, :2] -= fold * _sign_not_zero(normals[:, :2])
+    return _normalize(normals)
+
+def pack_octahedral(encoded, bits):
+    steps = (1 << bits) - 1
+    quantized = np.rint((np.clip(encoded, -1.0, 1.0) * 0.5 + 0.5) * steps)
+    return quantized[:, 0] * (1 << bits) + quantized[:, 1]
+
+def unpack_octahedral(packed, bits):
+    packed = np.asarray(packed, dtype=np.float64)
+    quantized_x = np.floor(packed / (1 << bits))
+    quantized_y = packed - quantized_x * (1 << bits)
+    return np.stack((quantized_x, quantized_y), axis=1) / ((1 << bits) - 1) * 2.0 - 1.0
+
+# (loops, 2) float2 encodings or (loops,) packed values, as float32 ready for the uv map
+def encode_normals(normals, encoding):
+    if encoding == 'RAW_XY':
+        encoded = normals[:, :2]
+    elif encoding == 'OCTAHEDRAL':
+        encoded = octahedral_encode(normals)
+    else:
+        encoded = pack_octahedral(octahedral_encode(normals), _PACKED_BITS[encoding])
+    return np.ascontiguousarray(encoded, dtype=np.float32)
+
+# what a shader reading the uv map gets back
+def decode_normals(encoded, encoding):
+    if encoding == 'RAW_XY':
+        normals = np.empty((len(encoded), 3))
+        normals[:, :2] = encoded
+        normals[:, 2] = np.sqrt(np.clip(1.0 - (normals[:, :2] ** 2).sum(axis=1), 0.0, None))
+        return normals
+    if encoding == 'OCTAHEDRAL':
+        return octahedral_decode(encoded)
+    return octahedral_decode(unpack_octahedral(encoded, _PACKED_BITS[encoding]))
+
+# angle in degrees between original and decoded normals, zero normals are skipped
+def angular_error(normals, decoded):
+    valid = np.linalg.norm(normals, axis=1) > 0
+    cosines = np.einsum("ij,ij->i", _normalize(normals[valid]), _normalize(decoded[valid]))
+    return np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0)))
+
+# the original per-loop transform, kept to verify the bulk path against UV_TOLERANCE
+def reference_uvs(mesh, smooth_normals):
+    mesh.calc_tangents(uvmap=mesh.uv_layers[0].name)
+    uvs = np.zeros((len(mesh.loops), 2), dtype=np.float32)
+    for loop in mesh.loops:
+        normal = mathutils.Vector(smooth_normals[loop.index])
+
+        transformed_normal = mathutils.Vector((0, 0, 0))
+        transformed_normal.x = normal.dot(loop.tangent.normalized())
+        transformed_normal.y = normal.dot(loop.normal.normalized())
+        transformed_normal.z = normal.dot(loop.bitangent.normalized())
+        transformed_normal.normalize()
+
+        uvs[loop.index] = transformed_normal.xy
+
+    mesh.free_tangents()
+    return uvs
+
+
+# normal of the face each loop belongs to
+def read_loop_face_normals(arrays):
+    face_normals, loop_starts, loop_totals = arrays.face_normals, arrays.loop_starts, arrays.loop_totals
+    order = np.argsort(loop_starts, kind="stable")
+    return face_normals[np.repeat(order, loop_totals[order])]
+
+
+# loops per chunk of the corner matching, bounds the (loops x valence x 3) temporaries
+_TRANSFER_CHUNK = 1 << 18
+
+# rings of grid cells searched around a query before it falls back to the KDTree
+_GRID_RINGS = 2
+
+# cells at chebyshev distance ring from (0, 0, 0)
+def _ring_offsets(ring):
+    steps = np.arange(-ring, ring + 1)
+    offsets = np.stack(np.meshgrid(steps, steps, steps, indexing="ij"), axis=-1).reshape(-1, 3)
+    return offsets[np.abs(offsets).max(axis=1) == ring]
+
+# nearest point lookup in numpy over a uniform grid of cells about two edges wide, so the threads
+# of a bake overlap on it as well (KDTree.find holds the GIL). a query is settled by the rings
+# around its cell once its nearest point is closer than any cell outside them; the rest, targets
+# far from the source, are left at -1 for the caller's KDTree
+class PointGrid:
+    def __init__(self, points, edge_length):
+        self.origin = points.min(axis=0)
+        extent = float((points.max(axis=0) - self.origin).max())
+        # at most 2^20 cells per axis, so the cell keys fit in an int64
+        self.cell = max(2.0 * edge_length, extent / (1 << 20), 1e-9)
+        cells = np.floor((points - self.origin) / self.cell).astype(np.int64)
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, starts, counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.starts, self.ends = starts, starts + counts
+        self.points = points
+
+    @staticmethod
+    def _keys(cells):
+        return (cells[:, 0] << 42) | (cells[:, 1] << 21) | cells[:, 2]
+
+    def nearest(self, queries):
+        best = np.full(len(queries), -1, dtype=np.int64)
+        best_distance = np.full(len(queries), np.inf)
+        query_cells = np.floor((queries - self.origin) / self.cell).astype(np.int64)
+        active = np.arange(len(queries))
+        for ring in range(_GRID_RINGS + 1):
+            for offset in _ring_offsets(ring):
+                cells = query_cells[active] + offset
+                inside = ((cells >= 0) & (cells < 1 << 21)).all(axis=1)
+                found = np.searchsorted(self.keys, self._keys(cells[inside]))
+                found = np.minimum(found, len(self.keys) - 1)
+                hit = self.keys[found] == self._keys(cells[inside])
+                owners, found = active[inside][hit], found[hit]
+
+                # every (query, point in its cell) pair
+                counts = self.ends[found] - self.starts[found]
+                pairs = np.repeat(owners, counts)
+                firsts = np.repeat(self.starts[found] - (np.cumsum(counts) - counts), counts)
+                candidates = self.order[firsts + np.arange(len(pairs))]
+                distance = np.einsum("ij,ij->i", queries[pairs] - self.points[candidates], queries[pairs] - self.points[candidates])
+
+                np.minimum.at(best_distance, pairs, distance)
+                closest = distance == best_distance[pairs]
+                best[pairs[closest]] = candidates[closest]
+
+            # points outside the searched rings are at least ring cells away
+            active = active[best_distance[active] > (ring * self.cell) ** 2]
+            if not len(active):
+                break
+        best[active] = -1
+        return best
+
+# spatial lookup over a source mesh for the nearest corner / best matching face normal transfer,
+# the same mapping as the DATA_TRANSFER modifier's NEAREST_POLYNOR loop mapping.
+# built once per source mesh content and shared across bakes and targets
+class SourceIndex:
+    def __init__(self, arrays):
+        positions = arrays.positions
+        loop_vertices = arrays.loop_vertices
+        self.loop_normals = _normalize(arrays.loop_normals)
+        self.loop_face_normals = read_loop_face_normals(arrays)
+
+        # corners around each vertex, padded with -1 up to the highest valence
+        counts = np.bincount(loop_vertices, minlength=len(positions))
+        order = np.argsort(loop_vertices, kind="stable")
+        starts = np.cumsum(counts) - counts
+        ranks = np.arange(len(order)) - np.repeat(starts, counts)
+        self.vertex_corners = np.full((len(positions), counts.max(initial=1)), -1, dtype=np.int64)
+        self.vertex_corners[loop_vertices[order], ranks] = order
+
+        # loose vertices have no corner to copy from, keep them out of the lookup
+        self.tree_vertices = np.flatnonzero(counts)
+        edges = arrays.edges
+        edge_lengths = np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]], axis=1)
+        self.grid = PointGrid(positions[self.tree_vertices].astype(np.float64), float(np.median(edge_lengths)) if len(edges) else 0.0)
+        self.tree = kdtree.KDTree(len(self.tree_vertices))
+        for tree_index, co in enumerate(positions[self.tree_vertices].tolist()):
+            self.tree.insert(co, tree_index)
+        self.tree.balance()
+
+    # smoothed normal for every target loop, in target local space.
+    # target_to_source maps target local space into source local space
+    def transfer(self, positions, loop_vertices, loop_face_normals, target_to_source):
+        matrix = np.asarray(target_to_source, dtype=np.float64)
+        linear = matrix[:3, :3]
+
+        positions = positions @ linear.T + matrix[:3, 3]
+        nearest = self.grid.nearest(positions)
+        far = np.flatnonzero(nearest < 0)
+        if len(far):
+            find = self.tree.find
+            nearest[far] = np.fromiter((find(co)[1] for co in positions[far].tolist()), dtype=np.int64, count=len(far))
+        nearest = self.tree_vertices[nearest]
+
+        # face normals into source space use the inverse transpose
+        face_normals = _normalize(loop_face_normals @ np.linalg.inv(linear))
+
+        smooth_normals = np.empty((len(loop_vertices), 3), dtype=np.float32)
+        for start in range(0, len(loop_vertices), _TRANSFER_CHUNK):
+            chunk = slice(start, start + _TRANSFER_CHUNK)
+            candidates = self.vertex_corners[nearest[loop_vertices[chunk]]]
+            scores = np.einsum("lcj,lj->lc", self.loop_face_normals[candidates], face_normals[chunk])
+            scores[candidates < 0] = -np.inf
+            best = candidates[np.arange(len(candidates)), scores.argmax(axis=1)]
+            smooth_normals[chunk] = self.loop_normals[best]
+
+        # and back into target space, again with the inverse transpose
+        return _normalize(smooth_normals @ linear).astype(np.float32)
+
+
+_SOURCE_INDEX_CACHE_SIZE = 4
+_source_indices = OrderedDict()
+
+# source index of an object's evaluated mesh, rebuilt only when the mesh content changes
+def get_source_index(source_object, depsgraph):
+    evaluated = source_object.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        if not mesh.polygons:
+            return None
+        # a temporary mesh, its arrays are only shared between the hash and the index
+        arrays = ku.MeshArrays(mesh)
+        key = arrays.content_hash(arrays.loop_normals)
+        if key not in _source_indices:
+            _source_indices[key] = SourceIndex(arrays)
+            while len(_source_indices) > _SOURCE_INDEX_CACHE_SIZE:
+                _source_indices.popitem(last=False)
+        _source_indices.move_to_end(key)
+        return _source_indices[key]
+    finally:
+        evaluated.to_mesh_clear()
 
 
 class SmoothNormalToUVButtonOperator(bpy.types.Operator):
@@ -188,7 +432,23 @@ class SmoothNormalToUVOperatorPanel(bpy.types.Panel):
         row.prop(context.window_manager, 'source_object')
 
         row = layout.row()
-        row.prop(context.window_manager, 'target_object')
+        row.prop(context.window_manager, 'smooth_normal_targets', expand=True)
+
+        targets = context.window_manager.smooth_normal_targets
+        if targets == 'OBJECT':
+            row = layout.row()
+            row.prop(context.window_manager, 'target_object')
+        elif targets == 'COLLECTION':
+            row = layout.row()
+            row.prop(context.window_manager, 'target_collection')
+
+        row = layout.row()
+        row.prop(context.window_manager, 'smooth_normal_encoding')
+        row = layout.row()
+        row.prop(context.window_manager, 'smooth_normal_uv_index')
+
+        row = layout.row()
+        row.prop(context.window_manager, 'smooth_normal_threads')
 
         # Button
         row = layout.row()
@@ -198,16 +458,45 @@ def register():
     ### properties
     bpy.types.WindowManager.source_object = bpy.props.PointerProperty(name="Source Object", type=bpy.types.Object)
     bpy.types.WindowManager.target_object = bpy.props.PointerProperty(name="Target Object", type=bpy.types.Object)
+    bpy.types.WindowManager.target_collection = bpy.props.PointerProperty(name="Target Collection", type=bpy.types.Collection)
+    bpy.types.WindowManager.smooth_normal_targets = bpy.props.EnumProperty(
+        name="Targets",
+        items=[
+            ('OBJECT', "Object", "Bake the target object"),
+            ('SELECTED', "Selected", "Bake every selected mesh"),
+            ('COLLECTION', "Collection", "Bake every mesh in the target collection"),
+        ],
+        default='OBJECT'
+    )
+    bpy.types.WindowManager.smooth_normal_encoding = bpy.props.EnumProperty(
+        name="Encoding",
+        items=[
+            ('RAW_XY', "Raw XY", "Tangent space x, y as float2, z is rebuilt without its sign"),
+            ('OCTAHEDRAL', "Octahedral", "Octahedral encoded unit vector as float2"),
+            ('OCT16', "Octahedral 16-bit", "8+8 bit octahedral packed into u, v is left untouched"),
+            ('OCT8', "Octahedral 8-bit", "4+4 bit octahedral packed into u, v is left untouched"),
+        ],
+        default='RAW_XY'
+    )
+    bpy.types.WindowManager.smooth_normal_uv_index = bpy.props.IntProperty(name="UV Map Index", description="UV map to bake into, missing maps are added. Map 0 holds the texture uvs the tangents are calculated on", default=2, min=1, max=7)
+    bpy.types.WindowManager.smooth_normal_threads = bpy.props.IntProperty(name="Threads", description="Worker threads for the per-target array math", default=min(8, os.cpu_count() or 1), min=1)
 
     bpy.utils.register_class(SmoothNormalToUVOperator)
     bpy.utils.register_class(SmoothNormalToUVButtonOperator)
     bpy.utils.register_class(SmoothNormalToUVOperatorPanel)
 
 def unregister():
-    del bpy.types.WindowManager.custom_input
+    del bpy.types.WindowManager.source_object
+    del bpy.types.WindowManager.target_object
+    del bpy.types.WindowManager.target_collection
+    del bpy.types.WindowManager.smooth_normal_targets
+    del bpy.types.WindowManager.smooth_normal_encoding
+    del bpy.types.WindowManager.smooth_normal_uv_index
+    del bpy.types.WindowManager.smooth_normal_threads
     bpy.utils.unregister_class(SmoothNormalToUVOperator)
     bpy.utils.unregister_class(SmoothNormalToUVButtonOperator)
     bpy.utils.unregister_class(SmoothNormalToUVOperatorPanel)
+    ku.release_mesh_arrays()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
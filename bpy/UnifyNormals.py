@@ -1,84 +1,368 @@
 import bpy
 import bmesh
+import numpy as np
 from mathutils import Vector
 
+import KrusUtilities as ku
+
 class UnifyNormalsOperator(bpy.types.Operator):
     bl_idname = "object.unify_normals_operator"
     bl_label = "Unify Normals Operator"
 
+    @ku.profiled
     def execute(self, context):
-        selected_objects = bpy.context.selected_objects
+        wm = bpy.context.window_manager
         color_name = "NormalColor"
-        b_write_into_vertex_color = bpy.context.window_manager.b_write_into_vertex_color
+        b_write_into_vertex_color = wm.b_write_into_vertex_color
+        color_type = wm.normal_color_type
+        mode = wm.unify_normals_mode
+        objects = context.scene.objects if wm.unify_normals_scope == 'SCENE' else context.selected_objects
 
-        for obj in selected_objects:
-            if obj.type == 'MESH':
-                mesh = obj.data
-                bbox = obj.bound_box
+        # Mesh data is only written in object mode
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
 
-                # Get bbox center and radius
-                local_bbox_center = 0.125 * sum((Vector(b) for b in obj.bound_box), Vector())
-                global_bbox_center = obj.matrix_world @ local_bbox_center
+        field = {
+            "centers": wm.unify_normals_centers,
+            "assignment": wm.unify_normals_assignment,
+            "clusters": wm.unify_normals_clusters,
+            "falloff": wm.unify_normals_falloff,
+        }
 
-                min_corner = Vector(bbox[0])
-                max_corner = Vector(bbox[6])
-                radius = (max_corner - min_corner).length / 2
+        cancelled = False
+        if mode == 'ANALYTIC':
+            def progress(done, total):
+                wm.progress_update(done / max(total, 1))
 
-                # Create a smooth sphere 
-                bpy.ops.mesh.primitive_uv_sphere_add(radius=radius, location=global_bbox_center)
-                sphere = bpy.context.object
-                bpy.ops.object.shade_smooth()
+            wm.progress_begin(0, 1)
+            try:
+                timers, cancelled = unify_meshes(context, objects, b_write_into_vertex_color, color_name, color_type, progress, field)
+            finally:
+                wm.progress_end()
+        else:
+            timers = [self.sphere_transfer(context, obj, b_write_into_vertex_color, color_name, color_type)
+                      for obj in unique_mesh_objects(objects)]
 
-                # Add DATA_TRANSFER modifier for obj
-                bpy.ops.object.select_all(action='DESELECT')
+        # per mesh, then the whole run
+        for timer in timers:
+            self.report({'INFO'}, timer.summary())
+        self.report({'INFO'}, timing_report(timers))
+        return {'CANCELLED'} if cancelled else {'FINISHED'}
 
-                data_transfer_modifier = obj.modifiers.new(name="DataTransfer", type='DATA_TRANSFER')
-                data_transfer_modifier.use_loop_data = True
-                data_transfer_modifier.data_types_loops = {'CUSTOM_NORMAL'}
-                data_transfer_modifier.object = sphere
-                
-                # Apply modifier
-                bpy.ops.object.select_all(action='DESELECT')
-                obj.select_set(True)
-                bpy.context.view_layer.objects.active = obj
-                bpy.ops.object.modifier_apply(modifier="DataTransfer")
+    def sphere_transfer(self, context, obj, b_write_into_vertex_color, color_name, color_type):
+        mesh = obj.data
+        timer = ku.StageTimer(mesh.name)
+        local_bbox_center, radius = bbox_sphere(obj)
+        global_bbox_center = obj.matrix_world @ local_bbox_center
 
-                # Delete sphere
-                bpy.ops.object.select_all(action='DESELECT')
-                sphere.select_set(True)
-                bpy.ops.object.delete()
+        with timer.stage("sphere_transfer"):
+            # Create a smooth sphere 
+            bpy.ops.mesh.primitive_uv_sphere_add(radius=radius, location=global_bbox_center)
+            sphere = bpy.context.object
+            bpy.ops.object.shade_smooth()
 
-                mesh.update()
+            # Add DATA_TRANSFER modifier for obj
+            bpy.ops.object.select_all(action='DESELECT')
 
-                if b_write_into_vertex_color:
-                    self.report({'INFO'}, "Writing normals into vertex color")
-                    # Ensure the object is in object mode
-                    bpy.ops.object.mode_set(mode='OBJECT')
+            data_transfer_modifier = obj.modifiers.new(name="DataTransfer", type='DATA_TRANSFER')
+            data_transfer_modifier.use_loop_data = True
+            data_transfer_modifier.data_types_loops = {'CUSTOM_NORMAL'}
+            data_transfer_modifier.object = sphere
 
-                    if color_name not in mesh.color_attributes:
-                        mesh.color_attributes.new(name=color_name, type="FLOAT_COLOR", domain="CORNER")
-                    color_layer = mesh.color_attributes[color_name]
-                    self.report({'INFO'}, "Created new color attribute")
+            # Apply modifier
+            bpy.ops.object.select_all(action='DESELECT')
+            obj.select_set(True)
+            bpy.context.view_layer.objects.active = obj
+            bpy.ops.object.modifier_apply(modifier="DataTransfer")
+            ku.invalidate_mesh(mesh)
 
-                    color_data = color_layer.data
+            # Delete sphere
+            bpy.ops.object.select_all(action='DESELECT')
+            sphere.select_set(True)
+            bpy.ops.object.delete()
 
-                    # Remap normals and store in vertex color
-                    for poly in mesh.polygons:
-                        for loop_index in poly.loop_indices:
-                            loop = mesh.loops[loop_index]
-                            normal = loop.normal
-                            # Remap normal from (-1, 1) to (0, 1)
-                            remapped_normal = normal * 0.5 + Vector((0.5, 0.5, 0.5))
-                            color_data[loop_index].color = (remapped_normal.x, remapped_normal.y, remapped_normal.z, 1.0)  # RGBA
+        if b_write_into_vertex_color:
+            with timer.stage("vertex_color"):
+                write_normals_to_color(mesh, color_name, color_type, ku.mesh_arrays(mesh).loop_normals)
+                clear_custom_normals(mesh)
 
-                    mesh.update()
+        mesh.update()
+        return timer
 
-                    bpy.context.view_layer.objects.active = obj
-                    bpy.ops.mesh.customdata_custom_splitnormals_clear()
+# Get bbox center (object space) and radius
+def bbox_sphere(obj):
+    corners = np.array(obj.bound_box)
+    local_bbox_center = Vector(corners.mean(axis=0))
 
+    radius = float(np.linalg.norm(corners[6] - corners[0])) / 2
+    return local_bbox_center, radius
 
+# one object per mesh datablock; instances share one set of custom normals,
+# so the first object found supplies the bbox and transform for all of them
+def unique_mesh_objects(objects):
+    mesh_objects = {}
+    for obj in objects:
+        # linked library meshes can't be edited
+        if obj.type == 'MESH' and obj.data.library is None:
+            mesh_objects.setdefault(obj.data.as_pointer(), obj)
+    return list(mesh_objects.values())
+
+# Normals of a sphere centered on the bbox, or of a proxy field with several centers,
+# computed exactly per vertex, on mesh data only
+def unify_mesh(context, obj, b_write_into_vertex_color, color_name, color_type, field=None):
+    mesh = obj.data
+    timer = ku.StageTimer(mesh.name)
+
+    with timer.stage("normals"):
+        if field is None or field["centers"] == 'BBOX':
+            # the radius doesn't change the direction of a sphere normal
+            normals = spherical_normals(obj, bbox_sphere(obj)[0])
+        else:
+            normals = proxy_field_normals(obj, field)
+    if b_write_into_vertex_color:
+        # the custom normals would be cleared right after, write the colors directly
+        with timer.stage("vertex_color"):
+            write_normals_to_color(mesh, color_name, color_type, normals[ku.mesh_arrays(mesh).loop_vertices])
+            clear_custom_normals(mesh)
+    else:
+        with timer.stage("custom_normals"):
+            set_custom_normals(mesh, normals)
+
+    mesh.update()
+    return timer
+
+# one line for the whole run: the stages summed over all meshes and the slowest mesh
+def timing_report(timers):
+    stages = {}
+    for timer in timers:
+        for stage_name, seconds in timer.stages.items():
+            stages[stage_name] = stages.get(stage_name, 0.0) + seconds
+    report = f"Unified normals of {len(timers)} meshes in {sum(stages.values()) * 1000:.1f}ms"
+    if stages:
+        report += " (" + ", ".join(f"{stage_name} {seconds * 1000:.1f}ms" for stage_name, seconds in stages.items()) + ")"
+    if len(timers) > 1:
+        report += f", slowest {max(timers, key=lambda timer: timer.total).summary()}"
+    return report
+
+# unify every mesh datablock used by objects exactly once, without bpy.ops and without
+# touching selection or the active object. progress(done, total) is called after every mesh,
+# returning False from it cancels the remaining meshes
+def unify_meshes(context, objects, b_write_into_vertex_color, color_name, color_type, progress=None, field=None):
+    mesh_objects = unique_mesh_objects(objects)
+    timers = []
+    for done, obj in enumerate(mesh_objects, 1):
+        timers.append(unify_mesh(context, obj, b_write_into_vertex_color, color_name, color_type, field))
+        if progress is not None and progress(done, len(mesh_objects)) is False:
+            return timers, True
+    return timers, False
+
+# custom normals pointing away from the bbox center, which is what the DATA_TRANSFER
+# from a smooth sphere centered on the bbox approximates, without the sphere's tessellation
+def spherical_normals(obj, local_center):
+    positions = ku.mesh_arrays(obj.data).positions
+    linear = np.array(obj.matrix_world.to_3x3())
+    # sphere normals live in world space (p - center after the object transform)
+    return object_space_normals((positions - np.array(local_center)) @ linear.T, linear)
+
+# world space normals -> object space normals, the transpose of the object's linear transform
+def object_space_normals(world_normals, linear):
+    # a vertex on the center gets a zero normal, which keeps its default normal
+    return _normalize(world_normals @ linear)
+
+def _normalize(vectors):
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+
+
+### proxy fields: normals radiating from several centers
+# field = {"centers": 'ISLANDS' | 'VERTEX_GROUPS' | 'KMEANS',
+#          "assignment": 'NEAREST' | 'WEIGHTED', "clusters": k-means count, "falloff": weight power}
+# every vertex takes the direction from its own center (nearest), or the inverse distance
+# weighted blend of the directions from its _BLEND_CENTERS nearest centers (weighted).
+# islands always use their own center, vertex groups blend by their weights
+
+_BLEND_CENTERS = 4
+# points per chunk of the nearest center search, bounds the (points x centers) distance matrix
+_SEARCH_CHUNK = 1 << 16
+_KMEANS_SAMPLE = 50000
+
+def proxy_field_normals(obj, field):
+    mesh = obj.data
+    positions = ku.mesh_arrays(mesh).positions.astype(np.float64)
+    linear = np.array(obj.matrix_world.to_3x3())
+    # distances and blends happen in world space, like the sphere normals
+    world_positions = positions @ linear.T
+
+    if field["centers"] == 'ISLANDS':
+        labels = mesh_islands(mesh)
+        centers = island_centers(positions, labels) @ linear.T
+        directions = world_positions - centers[labels]
+    elif field["centers"] == 'VERTEX_GROUPS':
+        directions = vertex_group_directions(obj, world_positions, field)
+    else:
+        centers = kmeans(world_positions, field["clusters"])
+        directions = center_directions(world_positions, centers, field["assignment"], field["falloff"])
+
+    return object_space_normals(directions, linear)
+
+# island index of every vertex, by label propagation over the edges with pointer jumping,
+# a few passes over the edge arrays even with tens of thousands of islands
+def mesh_islands(mesh):
+    edges = ku.mesh_arrays(mesh).edges
+    labels = np.arange(len(mesh.vertices))
+    while True:
+        labels_a = labels[edges[:, 0]]
+        labels_b = labels[edges[:, 1]]
+        # hook every root onto the smallest root it touches
+        hooked = labels.copy()
+        np.minimum.at(hooked, labels_a, labels_b)
+        np.minimum.at(hooked, labels_b, labels_a)
+        # then point every vertex straight at its root
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+    return np.unique(labels, return_inverse=True)[1]
+
+# bbox center of every island, the same center the single sphere uses for a whole object
+def island_centers(positions, labels):
+    order = np.argsort(labels, kind="stable")
+    starts = np.flatnonzero(np.diff(labels[order], prepend=-1))
+    lows = np.minimum.reduceat(positions[order], starts, axis=0)
+    highs = np.maximum.reduceat(positions[order], starts, axis=0)
+    return (lows + highs) * 0.5
+
+# indices and distances of the `count` nearest centers of every point, nearest first
+def nearest_centers(points, centers, count):
+    count = min(count, len(centers))
+    indices = np.empty((len(points), count), dtype=np.int64)
+    distances = np.empty((len(points), count))
+    center_lengths = (centers ** 2).sum(axis=1)
+    for start in range(0, len(points), _SEARCH_CHUNK):
+        chunk = slice(start, start + _SEARCH_CHUNK)
+        squared = (points[chunk] ** 2).sum(axis=1)[:, None] - 2.0 * points[chunk] @ centers.T + center_lengths
+        np.maximum(squared, 0.0, out=squared)
+        if count == 1:
+            nearest = squared.argmin(axis=1)[:, None]
+        else:
+            nearest = np.argpartition(squared, count - 1, axis=1)[:, :count] if count < len(centers) \
+                else np.broadcast_to(np.arange(count), squared.shape)
+            nearest = np.take_along_axis(nearest, np.take_along_axis(squared, nearest, axis=1).argsort(axis=1), axis=1)
+        indices[chunk] = nearest
+        distances[chunk] = np.sqrt(np.take_along_axis(squared, nearest, axis=1))
+    return indices, distances
+
+def center_directions(points, centers, assignment, falloff):
+    if assignment == 'NEAREST':
+        nearest = nearest_centers(points, centers, 1)[0][:, 0]
+        return points - centers[nearest]
+    indices, distances = nearest_centers(points, centers, _BLEND_CENTERS)
+    weights = 1.0 / np.maximum(distances, 1e-8) ** falloff
+    directions = _normalize(points[:, None, :] - centers[indices])
+    return (directions * weights[..., None]).sum(axis=1)
+
+# seeded k-means++ and Lloyd iterations on a sample of the points, deterministic per mesh
+def kmeans(points, clusters, iterations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    clusters = max(1, min(clusters, len(points)))
+    sample = points if len(points) <= _KMEANS_SAMPLE else points[rng.choice(len(points), _KMEANS_SAMPLE, replace=False)]
+
+    centers = np.empty((clusters, 3))
+    centers[0] = sample[rng.integers(len(sample))]
+    squared = ((sample - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, clusters):
+        total = squared.sum()
+        centers[i] = sample[rng.choice(len(sample), p=squared / total) if total > 0 else rng.integers(len(sample))]
+        squared = np.minimum(squared, ((sample - centers[i]) ** 2).sum(axis=1))
+
+    for _ in range(iterations):
+        labels = nearest_centers(sample, centers, 1)[0][:, 0]
+        counts = np.bincount(labels, minlength=clusters)
+        filled = counts > 0
+        moved = centers.copy()
+        for axis in range(3):
+            moved[filled, axis] = np.bincount(labels, weights=sample[:, axis], minlength=clusters)[filled] / counts[filled]
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+    return centers
+
+# (vertex, group, weight) of every non zero deform weight.
+# Blender has no bulk accessor for these, so this is one pass over the vertices
+def vertex_group_weights(mesh):
+    vertices, groups, weights = [], [], []
+    for vertex in mesh.vertices:
+        for element in vertex.groups:
+            if element.weight > 0.0:
+                vertices.append(vertex.index)
+                groups.append(element.group)
+                weights.append(element.weight)
+    return np.array(vertices, dtype=np.int64), np.array(groups, dtype=np.int64), np.array(weights)
+
+# a center per vertex group (weighted centroid); grouped vertices follow their heaviest group
+# or blend by weight, vertices outside every group use the nearest group centers
+def vertex_group_directions(obj, points, field):
+    vertices, groups, weights = vertex_group_weights(obj.data)
+    if len(vertices) == 0:
+        # no weights to go by, fall back to the single bbox sphere
+        center = np.array(bbox_sphere(obj)[0]) @ np.array(obj.matrix_world.to_3x3()).T
+        return points - center
+
+    group_count = groups.max() + 1
+    totals = np.bincount(groups, weights=weights, minlength=group_count)
+    centers = np.stack([np.bincount(groups, weights=weights * points[vertices, axis], minlength=group_count) for axis in range(3)], axis=1)
+    used = np.flatnonzero(totals)
+    centers = centers[used] / totals[used, None]
+    # group index -> row in centers
+    groups = np.searchsorted(used, groups)
+
+    directions = center_directions(points, centers, field["assignment"], field["falloff"])
+    if field["assignment"] == 'NEAREST':
+        order = np.lexsort((-weights, vertices))
+        heaviest = order[np.diff(vertices[order], prepend=-1) != 0]
+        directions[vertices[heaviest]] = points[vertices[heaviest]] - centers[groups[heaviest]]
+    else:
+        grouped = np.unique(vertices)
+        blended = _normalize(points[vertices] - centers[groups]) * weights[:, None]
+        directions[grouped] = np.stack([np.bincount(vertices, weights=blended[:, axis], minlength=len(points)) for axis in range(3)], axis=1)[grouped]
+    return directions
+
+def set_custom_normals(mesh, vertex_normals):
+    # custom normals only show with auto smooth before Blender 4.1
+    if hasattr(mesh, "use_auto_smooth"):
+        mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set_from_vertices(vertex_normals)
+    ku.invalidate_mesh(mesh)
+
+# on mesh data only, without bpy.ops or a context override
+def clear_custom_normals(mesh):
+    if not mesh.has_custom_normals:
+        return
+    # newer Blender keeps custom normals as a generic attribute
+    if "custom_normal" in mesh.attributes:
+        mesh.attributes.remove(mesh.attributes["custom_normal"])
+    else:
+        # zero vectors reset every corner to its automatic normal
+        mesh.normals_split_custom_set(np.zeros((len(mesh.loops), 3), dtype=np.float32))
+        # before Blender 4.1 the split normals computed from the old layer stay cached
+        if hasattr(mesh, "free_normals_split"):
+            mesh.free_normals_split()
+    ku.invalidate_mesh(mesh)
+
+# Remap loop normals from (-1, 1) to (0, 1) and store them in a corner color attribute.
+# FLOAT_COLOR stores them exactly (16 bytes per corner).
+# BYTE_COLOR takes 4 bytes per corner: every channel is rounded to 1/255, i.e. at most
+# 0.002 per color channel / 0.004 per normal component, and the decoded normal
+# (color * 2 - 1, normalized) is off by at most ~0.39 degrees (~0.17 on average)
+def write_normals_to_color(mesh, color_name, color_type, loop_normals):
+    colors = np.ones((len(loop_normals), 4), dtype=np.float32)  # RGBA
+    colors[:, :3] = loop_normals * 0.5 + 0.5
+    ku.write_colors(mesh, color_name, colors, color_type, 'CORNER')
 
-        return {'FINISHED'}
 
 class UnifyNormalsButtonOperator(bpy.types.Operator):
     bl_idname = "object.unify_normals_button"
@@ -100,8 +384,30 @@ class UnifyNormalsOperatorPanel(bpy.types.Panel):
         wm = context.window_manager
 
         # Property slider
+        row = layout.row()
+        row.prop(wm, "unify_normals_mode", expand=True)
+
+        row = layout.row()
+        row.prop(wm, "unify_normals_scope", expand=True)
+
+        if wm.unify_normals_mode == 'ANALYTIC':
+            row = layout.row()
+            row.prop(wm, "unify_normals_centers")
+            if wm.unify_normals_centers in {'VERTEX_GROUPS', 'KMEANS'}:
+                row = layout.row()
+                row.prop(wm, "unify_normals_assignment", expand=True)
+                if wm.unify_normals_assignment == 'WEIGHTED':
+                    row = layout.row()
+                    row.prop(wm, "unify_normals_falloff")
+            if wm.unify_normals_centers == 'KMEANS':
+                row = layout.row()
+                row.prop(wm, "unify_normals_clusters")
+
         row = layout.row()
         row.prop(wm, "b_write_into_vertex_color", text="Write into Vertex Color")
+        if wm.b_write_into_vertex_color:
+            row = layout.row()
+            row.prop(wm, "normal_color_type", expand=True)
 
         # Button
         row = layout.row()
@@ -116,12 +422,64 @@ def register():
         description="A custom boolean property",
         default=False
     )
+    bpy.types.WindowManager.normal_color_type = bpy.props.EnumProperty(
+        name="Color Type",
+        items=[
+            ('FLOAT_COLOR', "Float", "32-bit float per channel, exact"),
+            ('BYTE_COLOR', "Byte", "8-bit per channel, 4x smaller, normals off by up to ~0.39 degrees"),
+        ],
+        default='FLOAT_COLOR'
+    )
+    bpy.types.WindowManager.unify_normals_scope = bpy.props.EnumProperty(
+        name="Scope",
+        items=[
+            ('SELECTED', "Selected", "Meshes of the selected objects"),
+            ('SCENE', "Scene", "Meshes of every object in the scene"),
+        ],
+        default='SELECTED'
+    )
+    bpy.types.WindowManager.unify_normals_centers = bpy.props.EnumProperty(
+        name="Centers",
+        items=[
+            ('BBOX', "Bounding Box", "One sphere centered on the object's bbox"),
+            ('ISLANDS', "Mesh Islands", "One center per connected mesh island"),
+            ('VERTEX_GROUPS', "Vertex Groups", "One center per vertex group"),
+            ('KMEANS', "K-Means Clusters", "Centers of k-means clusters of the vertices"),
+        ],
+        default='BBOX'
+    )
+    bpy.types.WindowManager.unify_normals_assignment = bpy.props.EnumProperty(
+        name="Assignment",
+        items=[
+            ('NEAREST', "Nearest", "Every vertex radiates from one center"),
+            ('WEIGHTED', "Weighted", "Every vertex blends the directions of several centers"),
+        ],
+        default='NEAREST'
+    )
+    bpy.types.WindowManager.unify_normals_clusters = bpy.props.IntProperty(name="Clusters", description="Number of k-means centers", default=8, min=1, max=4096)
+    bpy.types.WindowManager.unify_normals_falloff = bpy.props.FloatProperty(name="Falloff", description="Inverse distance power of the weighted blend", default=2.0, min=0.0)
+    bpy.types.WindowManager.unify_normals_mode = bpy.props.EnumProperty(
+        name="Mode",
+        items=[
+            ('ANALYTIC', "Analytic", "Set normal(p - bbox center) on every vertex directly, no temporary objects"),
+            ('SPHERE', "Sphere Transfer", "Transfer normals from a temporary UV sphere with a Data Transfer modifier"),
+        ],
+        default='ANALYTIC'
+    )
 
 def unregister():
     bpy.utils.unregister_class(UnifyNormalsOperator)
     bpy.utils.unregister_class(UnifyNormalsButtonOperator)
     bpy.utils.unregister_class(UnifyNormalsOperatorPanel)
     del bpy.types.WindowManager.b_write_into_vertex_color
+    del bpy.types.WindowManager.normal_color_type
+    del bpy.types.WindowManager.unify_normals_scope
+    del bpy.types.WindowManager.unify_normals_centers
+    del bpy.types.WindowManager.unify_normals_assignment
+    del bpy.types.WindowManager.unify_normals_clusters
+    del bpy.types.WindowManager.unify_normals_falloff
+    del bpy.types.WindowManager.unify_normals_mode
+    ku.release_mesh_arrays()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
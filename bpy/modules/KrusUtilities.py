@@ -1,22 +1,621 @@
 import bpy 
+import bmesh
+import functools
+import hashlib
+import json
+import time
+import tracemalloc
+import numpy as np
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 
 # allow you to edit the copy of the object
 # without sabotaging the original object
+# the copy comes from the scratch pool, repeated calls refill the same object and mesh
 def copy_and_link_object(context, original_obj):
-    # Create a copy of the original object
-    copied_obj_name = original_obj.name + "_copy"
-    
-    # If an object with the same name already exists, delete it
-    if copied_obj_name in bpy.data.objects:
-        bpy.data.objects.remove(bpy.data.objects[copied_obj_name], do_unlink=True)
-    
-    # Copy the original object and its data
-    copied_data = original_obj.data.copy()
-    copied_obj = original_obj.copy()
-    copied_obj.data = copied_data
-    copied_obj.name = copied_obj_name
-    
-    # Link the copied object to the current collection
-    context.collection.objects.link(copied_obj)
-    
-    return copied_obj
\ No newline at end of file
+    return scratch_pool.acquire(context, original_obj)
+
+# custom property on every object the pool created, holding its key. objects without it
+# belong to the user and are never reused or removed, whatever their name
+_SCRATCH_TAG = "krus_scratch"
+
+# scratch objects that live across calls, found by key (<name>_copy for copies): a mesh copy keeps
+# its object and mesh datablock and only has its geometry refilled from the original, so previews
+# don't leave a trail of orphan meshes behind. other object types keep the object and swap in a
+# fresh data copy. objects a tool builds itself (acquire_new) are reused as they are
+class ScratchPool:
+    def __init__(self, suffix="_copy"):
+        self.suffix = suffix
+        # keys only, datablock references don't survive undo or file loads
+        self.names = set()
+        # keys of pooled objects that are a tool's output, reused but kept on release
+        self.kept = set()
+        # allocated: new objects, reused: allocations avoided, reclaimed: orphan datablocks removed
+        self.counters = {"allocated": 0, "reused": 0, "reclaimed": 0}
+
+    # the pooled object of key, None when there is none (or only a user object of that name)
+    def find(self, key):
+        scratch = bpy.data.objects.get(key)
+        if scratch is not None and scratch.get(_SCRATCH_TAG) == key:
+            return scratch
+        # renamed by Blender, e.g. when a user object already had the name
+        return next((obj for obj in bpy.data.objects if obj.get(_SCRATCH_TAG) == key), None)
+
+    def acquire(self, context, original_obj):
+        _install_scratch_handlers()
+        key = original_obj.name + self.suffix
+        scratch = self.find(key)
+
+        if scratch is not None and (scratch.type != original_obj.type or scratch.data is None
+                                    or scratch.data == original_obj.data or scratch.data.users > 1):
+            # ours, but not refillable any more (e.g. its data got shared)
+            self._remove(scratch)
+            scratch = None
+
+        if scratch is None:
+            # Copy the original object and its data
+            scratch = original_obj.copy()
+            scratch.data = original_obj.data.copy()
+            scratch.name = key
+            scratch[_SCRATCH_TAG] = key
+            self.counters["allocated"] += 1
+        else:
+            self._refill(scratch, original_obj)
+            self.counters["reused"] += 1
+        scratch.matrix_world = original_obj.matrix_world
+        return self._link(context, scratch, key)
+
+    # an object of object_type the caller fills itself, new_data(name) makes its data the first time.
+    # keep marks a tool's output: reused like the rest, but left in the file by release()
+    def acquire_new(self, context, key, object_type, new_data, keep=False):
+        _install_scratch_handlers()
+        scratch = self.find(key)
+        if scratch is not None and scratch.type != object_type:
+            self._remove(scratch)
+            scratch = None
+
+        if scratch is None:
+            scratch = bpy.data.objects.new(key, new_data(key))
+            scratch[_SCRATCH_TAG] = key
+            self.counters["allocated"] += 1
+        else:
+            self.counters["reused"] += 1
+        if keep:
+            self.kept.add(key)
+        return self._link(context, scratch, key)
+
+    def _link(self, context, scratch, key):
+        # Link the copied object to the current collection
+        if not scratch.users_collection:
+            context.collection.objects.link(scratch)
+        self.names.add(key)
+        return scratch
+
+    # hand a pooled object over to the user, e.g. a baked preview, the pool won't touch it again
+    def detach(self, scratch):
+        key = scratch.get(_SCRATCH_TAG)
+        if key is not None:
+            del scratch[_SCRATCH_TAG]
+            self.names.discard(key)
+            self.kept.discard(key)
+
+    def _refill(self, scratch, original_obj):
+        if original_obj.type == 'MESH':
+            bm = bmesh.new()
+            try:
+                bm.from_mesh(original_obj.data)
+                bm.to_mesh(scratch.data)
+            finally:
+                bm.free()
+            scratch.data.materials.clear()
+            for material in original_obj.data.materials:
+                scratch.data.materials.append(material)
+            scratch.data.update()
+        else:
+            previous = scratch.data
+            scratch.data = original_obj.data.copy()
+            self._reclaim(previous)
+
+    def _reclaim(self, data):
+        # data types without a known bpy.data collection are left for Blender's orphan purge
+        collection = _DATA_COLLECTIONS.get(type(data).__name__)
+        if data is not None and collection is not None and data.users == 0:
+            getattr(bpy.data, collection).remove(data)
+            self.counters["reclaimed"] += 1
+
+    def _remove(self, scratch):
+        data = scratch.data
+        bpy.data.objects.remove(scratch, do_unlink=True)
+        self._reclaim(data)
+
+    # remove one pooled object and its data, e.g. an output a tool no longer produces.
+    # objects without the tag are the user's and stay
+    def discard(self, scratch):
+        key = scratch.get(_SCRATCH_TAG)
+        if key is not None:
+            self.names.discard(key)
+            self.kept.discard(key)
+            self._remove(scratch)
+
+    # remove every pooled object that isn't a kept output, and its data, e.g. on unregister
+    def release(self):
+        for key in list(self.names - self.kept):
+            scratch = self.find(key)
+            if scratch is not None:
+                self._remove(scratch)
+        self.names.clear()
+        self.kept.clear()
+
+    def summary(self):
+        return ", ".join(f"{key} {value}" for key, value in self.counters.items()) + f", pooled {len(self.names)}"
+
+# bpy.data collection of each object data type the pool can reclaim
+_DATA_COLLECTIONS = {"Mesh": "meshes", "Curve": "curves", "TextCurve": "curves", "SurfaceCurve": "curves",
+                     "MetaBall": "metaballs", "GreasePencil": "grease_pencils", "Lattice": "lattices",
+                     "Camera": "cameras", "Armature": "armatures", "PointLight": "lights", "SunLight": "lights",
+                     "SpotLight": "lights", "AreaLight": "lights"}
+
+scratch_pool = ScratchPool()
+
+# a new file has none of the pooled objects, forget them
+@bpy.app.handlers.persistent
+def _forget_scratch_objects(*args):
+    scratch_pool.names.clear()
+    scratch_pool.kept.clear()
+
+def _install_scratch_handlers():
+    if _forget_scratch_objects not in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.append(_forget_scratch_objects)
+
+# for the tools' unregister: remove the pooled objects and the load handler
+def release_scratch_pool():
+    scratch_pool.release()
+    if _forget_scratch_objects in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(_forget_scratch_objects)
+
+# accumulate wall time per named stage of an operator run
+# usage: with timer.stage("read"): ...
+class StageTimer:
+    def __init__(self, name=""):
+        self.name = name
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, stage_name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add(stage_name, end - start)
+            if profiler.stack:
+                profiler.event(stage_name, "stage", start, end)
+
+    # record time measured elsewhere, e.g. on a worker thread
+    def add(self, stage_name, seconds):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+        if profiler.stack:
+            stages = profiler.stack[-1]["stages"]
+            stages[stage_name] = stages.get(stage_name, 0.0) + seconds
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def summary(self):
+        parts = [f"{stage_name} {seconds * 1000:.1f}ms" for stage_name, seconds in self.stages.items()]
+        return f"{self.name}: " + ", ".join(parts) + f" | total {self.total * 1000:.1f}ms"
+
+### opt-in profiling of the tools' operators
+# while profiler.enabled, every execute decorated with @profiled records a run: wall time, the
+# StageTimer stages inside it, bpy.ops calls and the mode switches among them, datablocks created
+# and removed, and the peak of Python allocations (tracemalloc). disabled, the decorator is one
+# attribute check, bpy.ops isn't patched and tracemalloc isn't running
+
+# operators counted as mode switches
+_MODE_OPERATORS = {"object.mode_set", "object.editmode_toggle", "object.posemode_toggle", "sculpt.sculptmode_toggle",
+                   "paint.vertex_paint_toggle", "paint.weight_paint_toggle", "paint.texture_paint_toggle"}
+# bpy.data collections whose datablocks are counted
+_PROFILED_DATA = ("objects", "meshes", "curves", "materials", "images", "collections", "node_groups")
+
+def _datablock_uids():
+    return {name: {block.session_uid for block in getattr(bpy.data, name)} for name in _PROFILED_DATA}
+
+def _datablock_counts():
+    return tuple(len(getattr(bpy.data, name)) for name in _PROFILED_DATA)
+
+class Profiler:
+    def __init__(self, history=50):
+        self.enabled = False
+        # finished runs, oldest first
+        self.runs = deque(maxlen=history)
+        # runs in progress, an operator called from a profiled operator gets a run of its own
+        self.stack = []
+        self.origin = time.perf_counter()
+        self._ops_class = None
+        self._ops_call = None
+        self._tracing = False
+        # datablock counts when the datablocks were last listed
+        self._counts = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._patch_ops()
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._unpatch_ops()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    # every bpy.ops.<module>.<name> is an instance of the same class, whatever a Blender version calls it
+    def _patch_ops(self):
+        ops_class = type(bpy.ops.object.select_all)
+        call = ops_class.__call__
+
+        def counted_call(op, *args, **kwargs):
+            if not self.stack:
+                return call(op, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return call(op, *args, **kwargs)
+            finally:
+                self._count_op(op.idname_py(), start, time.perf_counter())
+
+        ops_class.__call__ = counted_call
+        self._ops_class, self._ops_call = ops_class, call
+
+    def _unpatch_ops(self):
+        if self._ops_class is not None:
+            self._ops_class.__call__ = self._ops_call
+            self._ops_class = self._ops_call = None
+
+    def _count_op(self, idname, start, end):
+        for run in self.stack:
+            run["ops"][idname] = run["ops"].get(idname, 0) + 1
+            if idname in _MODE_OPERATORS:
+                run["mode_switches"] += 1
+        self.event(idname, "bpy.ops", start, end)
+        # datablocks an operator adds and a later one removes (e.g. a temporary object)
+        # still count as created and removed. the datablocks are only listed again when an
+        # operator changed how many there are, and the time that takes isn't part of the runs' wall time
+        counts = _datablock_counts()
+        if counts != self._counts:
+            sample_start = time.perf_counter()
+            self._sample(self.stack, _datablock_uids())
+            self._counts = counts
+            overhead = time.perf_counter() - sample_start
+            for run in self.stack:
+                run["_overhead"] += overhead
+
+    def _sample(self, runs, uids):
+        for run in runs:
+            for name, current in uids.items():
+                run["_seen"][name] |= current - run["_uids"][name]
+
+    # a timeline event of the innermost run, times from time.perf_counter()
+    def event(self, name, category, start, end):
+        self.stack[-1]["events"].append([name, category, start - self.origin, end - start])
+
+    def begin(self, operator_name):
+        if not self.stack:
+            tracemalloc.reset_peak()
+        uids = _datablock_uids()
+        self._counts = _datablock_counts()
+        self.stack.append({
+            "operator": operator_name,
+            "start": time.perf_counter() - self.origin,
+            "stages": {},
+            "ops": {},
+            "mode_switches": 0,
+            "events": [],
+            "_memory": tracemalloc.get_traced_memory()[0],
+            "_uids": uids,
+            "_seen": {name: set() for name in uids},
+            "_overhead": 0.0,
+        })
+
+    def end(self, result):
+        run = self.stack.pop()
+        run["wall"] = time.perf_counter() - self.origin - run["start"] - run.pop("_overhead")
+        uids = _datablock_uids()
+        self._sample(self.stack + [run], uids)
+        self._counts = _datablock_counts()
+        before, seen = run.pop("_uids"), run.pop("_seen")
+        run["created"] = {name: len(seen[name]) for name in uids if seen[name]}
+        run["removed"] = {name: len((before[name] | seen[name]) - uids[name]) for name in uids
+                          if (before[name] | seen[name]) - uids[name]}
+        # the peak since the outermost run started, relative to this run's start
+        run["peak_memory"] = max(0, tracemalloc.get_traced_memory()[1] - run.pop("_memory"))
+        run["result"] = sorted(result) if result else []
+        self.runs.append(run)
+
+    def clear(self):
+        self.runs.clear()
+
+    @staticmethod
+    def summary(run):
+        return (f"{run['operator']}: {run['wall'] * 1000:.1f}ms, {sum(run['ops'].values())} ops, "
+                f"{run['mode_switches']} mode switches, +{sum(run['created'].values())}/-{sum(run['removed'].values())} "
+                f"datablocks, peak {run['peak_memory'] / (1024 * 1024):.2f} MB")
+
+    # the runs as recorded, for comparing runs offline
+    def export_json(self, path):
+        with open(path, "w") as file:
+            json.dump({"blender": bpy.app.version_string, "runs": list(self.runs)}, file, indent=1)
+
+    # the runs in the Chrome trace event format, for chrome://tracing or ui.perfetto.dev
+    def export_chrome_trace(self, path):
+        def trace_event(name, category, start, duration, args=None):
+            return {"name": name, "cat": category, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6,
+                    "pid": 0, "tid": 0, "args": args or {}}
+
+        events = []
+        for run in self.runs:
+            args = {key: run[key] for key in ("stages", "ops", "mode_switches", "created", "removed", "peak_memory", "result")}
+            events.append(trace_event(run["operator"], "operator", run["start"], run["wall"], args))
+            events.extend(trace_event(*event) for event in run["events"])
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+profiler = Profiler()
+
+# decorator for an operator's execute, records a run while profiling is enabled
+# every run also starts and ends with an empty mesh array cache (see mesh_array_run)
+def profiled(execute):
+    @functools.wraps(execute)
+    def wrapper(operator, context):
+        with mesh_array_run():
+            if not profiler.enabled:
+                return execute(operator, context)
+            profiler.begin(operator.bl_idname)
+            result = None
+            try:
+                result = execute(operator, context)
+                return result
+            finally:
+                profiler.end(result)
+    return wrapper
+
+# like @profiled, for work that isn't an operator's execute (e.g. a timer callback), recorded without a result
+@contextmanager
+def profiled_run(name):
+    with mesh_array_run():
+        if not profiler.enabled:
+            yield
+            return
+        profiler.begin(name)
+        try:
+            yield
+        finally:
+            profiler.end(None)
+
+# read one property of a bpy collection (mesh.vertices, mesh.loops, ...) into a contiguous array.
+# dtype has to match the property (int fields are int32), otherwise foreach_get goes item by item
+def read_array(collection, attr, width=1, dtype=np.float32):
+    values = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, values)
+    return values.reshape(-1, width) if width > 1 else values
+
+# split normals of every loop; before Blender 4.1 they have to be computed first
+def read_loop_normals(mesh):
+    if hasattr(mesh, "calc_normals_split"):
+        mesh.calc_normals_split()
+    return read_array(mesh.loops, "normal", 3)
+
+# content hash of a mesh's geometry, for keying caches by mesh data instead of by name
+# extra_arrays (e.g. normals) are folded into the same digest
+def mesh_content_hash(mesh, *extra_arrays):
+    return MeshArrays(mesh).content_hash(*extra_arrays)
+
+# typed, contiguous arrays of one mesh, each read through foreach_get at most once.
+# the cached instance of a bpy.data mesh comes from mesh_arrays(mesh); temporary meshes
+# (evaluated to_mesh() results) get their own MeshArrays(mesh), since the next to_mesh()
+# reuses their address. the arrays are shared and read only, copy one before editing it
+class MeshArrays:
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.signature = mesh_signature(mesh)
+        self.arrays = {}
+
+    def _cached(self, key, read):
+        array = self.arrays.get(key)
+        if array is None:
+            array = read()
+            array.flags.writeable = False
+            self.arrays[key] = array
+        return array
+
+    # any property of a mesh collection, e.g. read("polygons", "material_index", dtype=np.int32)
+    def read(self, domain, attr, width=1, dtype=np.float32):
+        return self._cached((domain, attr), lambda: read_array(getattr(self.mesh, domain), attr, width, dtype))
+
+    @property
+    def positions(self):
+        return self.read("vertices", "co", 3)
+
+    @property
+    def loop_vertices(self):
+        return self.read("loops", "vertex_index", dtype=np.int32)
+
+    @property
+    def loop_starts(self):
+        return self.read("polygons", "loop_start", dtype=np.int32)
+
+    @property
+    def loop_totals(self):
+        return self.read("polygons", "loop_total", dtype=np.int32)
+
+    @property
+    def face_normals(self):
+        return self.read("polygons", "normal", 3)
+
+    @property
+    def edges(self):
+        return self.read("edges", "vertices", 2, np.int32)
+
+    @property
+    def loop_normals(self):
+        return self._cached("loop_normals", lambda: read_loop_normals(self.mesh))
+
+    # (tangents, bitangents, normals) of every loop, calculated on the uv map uv_name
+    def tangent_space(self, uv_name):
+        def read():
+            self.mesh.calc_tangents(uvmap=uv_name)
+            try:
+                return np.stack([read_array(self.mesh.loops, attr, 3) for attr in ("tangent", "bitangent", "normal")], axis=1)
+            finally:
+                self.mesh.free_tangents()
+        space = self._cached(("tangent_space", uv_name), read)
+        return space[:, 0], space[:, 1], space[:, 2]
+
+    def uvs(self, uv_name):
+        return self._cached(("uv", uv_name), lambda: read_array(self.mesh.uv_layers[uv_name].data, "uv", 2))
+
+    # RGBA of a color attribute, byte colors as their stored sRGB values (see write_colors)
+    def colors(self, color_name):
+        attribute = self.mesh.color_attributes[color_name]
+        field = "color_srgb" if attribute.data_type == 'BYTE_COLOR' else "color"
+        return self._cached(("color", color_name), lambda: read_array(attribute.data, field, 4))
+
+    def content_hash(self, *extra_arrays):
+        digest = hashlib.blake2b(digest_size=16)
+        for array in (self.positions, self.loop_vertices, self.loop_starts) + extra_arrays:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+# a cached MeshArrays only belongs to a mesh with the same name and element counts, which
+# catches a freed mesh's address being reused and topology edits the handlers haven't seen yet
+def mesh_signature(mesh):
+    return (mesh.name_full, len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons))
+
+_MESH_ARRAYS_CACHE_SIZE = 32
+_mesh_arrays = OrderedDict()
+
+# the cached arrays of a bpy.data mesh, dropped when the mesh is edited, on undo, on file load
+# and around every operator run
+def mesh_arrays(mesh):
+    _install_mesh_array_handlers()
+    key = mesh.as_pointer()
+    arrays = _mesh_arrays.get(key)
+    if arrays is None or arrays.signature != mesh_signature(mesh):
+        arrays = _mesh_arrays[key] = MeshArrays(mesh)
+        while len(_mesh_arrays) > _MESH_ARRAYS_CACHE_SIZE:
+            _mesh_arrays.popitem(last=False)
+    else:
+        # references don't survive undo, keep the caller's
+        arrays.mesh = mesh
+    _mesh_arrays.move_to_end(key)
+    return arrays
+
+# for changes made outside the writers below, e.g. by bpy.ops, before the next depsgraph update
+def invalidate_mesh(mesh):
+    _mesh_arrays.pop(mesh.as_pointer(), None)
+
+# scripts writing with foreach_set don't trigger a depsgraph update, so arrays cached before
+# an operator or preview rebuild can be stale: each run starts from an empty cache and
+# doesn't leave its arrays behind
+@contextmanager
+def mesh_array_run():
+    _mesh_arrays.clear()
+    try:
+        yield
+    finally:
+        _mesh_arrays.clear()
+
+@bpy.app.handlers.persistent
+def _drop_updated_meshes(scene, depsgraph):
+    if not _mesh_arrays:
+        return
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        data = update.id.original
+        if isinstance(data, bpy.types.Object):
+            data = data.data
+        if isinstance(data, bpy.types.Mesh):
+            invalidate_mesh(data)
+
+@bpy.app.handlers.persistent
+def _clear_mesh_arrays(*args):
+    _mesh_arrays.clear()
+
+_MESH_ARRAY_HANDLERS = ((bpy.app.handlers.depsgraph_update_post, _drop_updated_meshes),
+                        (bpy.app.handlers.load_pre, _clear_mesh_arrays),
+                        (bpy.app.handlers.undo_post, _clear_mesh_arrays),
+                        (bpy.app.handlers.redo_post, _clear_mesh_arrays))
+
+def _install_mesh_array_handlers():
+    for handlers, handler in _MESH_ARRAY_HANDLERS:
+        if handler not in handlers:
+            handlers.append(handler)
+
+# for the tools' unregister: drop the cached arrays and the handlers
+def release_mesh_arrays():
+    _mesh_arrays.clear()
+    for handlers, handler in _MESH_ARRAY_HANDLERS:
+        if handler in handlers:
+            handlers.remove(handler)
+
+# write one property of a bpy collection in bulk, the reverse of read_array
+def write_array(collection, attr, values, dtype=np.float32):
+    collection.foreach_set(attr, np.ascontiguousarray(values, dtype=dtype).ravel())
+
+# bulk writes into a mesh, the reverse of MeshArrays. they drop the mesh's cached arrays,
+# call mesh.update() once after the last one
+def write_mesh_array(mesh, domain, attr, values, dtype=np.float32):
+    write_array(getattr(mesh, domain), attr, values, dtype)
+    invalidate_mesh(mesh)
+
+# into the uv map uv_name, added when missing
+def write_uvs(mesh, uv_name, uvs):
+    uv_layer = mesh.uv_layers.get(uv_name) or mesh.uv_layers.new(name=uv_name)
+    write_array(uv_layer.data, "uv", uvs)
+    invalidate_mesh(mesh)
+    return uv_layer
+
+# RGBA into the color attribute color_name, replaced when its type or domain differ.
+# byte colors are stored in sRGB, color_srgb writes the values as they are
+# instead of running them through the linear -> sRGB conversion of "color"
+def write_colors(mesh, color_name, colors, color_type='FLOAT_COLOR', domain='CORNER'):
+    color_layer = mesh.color_attributes.get(color_name)
+    if color_layer is not None and (color_layer.data_type != color_type or color_layer.domain != domain):
+        mesh.color_attributes.remove(color_layer)
+        color_layer = None
+    if color_layer is None:
+        color_layer = mesh.color_attributes.new(name=color_name, type=color_type, domain=domain)
+    write_array(color_layer.data, "color_srgb" if color_type == 'BYTE_COLOR' else "color", colors)
+    invalidate_mesh(mesh)
+    return color_layer
+
+# fill an empty mesh in bulk: positions (V, 3), loop_vertices (L,) and the first loop of every
+# polygon (P,), optionally with a uv layer (L, 2)
+def fill_mesh(mesh, positions, loop_vertices, loop_starts, uvs=None, uv_name="UVMap"):
+    loop_starts = np.asarray(loop_starts, dtype=np.int32)
+    mesh.vertices.add(len(positions))
+    mesh.loops.add(len(loop_vertices))
+    mesh.polygons.add(len(loop_starts))
+    mesh.vertices.foreach_set("co", np.asarray(positions, dtype=np.float32).ravel())
+    mesh.loops.foreach_set("vertex_index", np.asarray(loop_vertices, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_start", loop_starts)
+    # polygon sizes follow from the loop starts since Blender 3.6, before that they are stored
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.diff(loop_starts, append=len(loop_vertices)).astype(np.int32))
+    if uvs is not None:
+        uv_layer = mesh.uv_layers.new(name=uv_name)
+        write_array(uv_layer.data, "uv", uvs)
+    mesh.update(calc_edges=True)
+    invalidate_mesh(mesh)
+    return mesh